@@ -0,0 +1,70 @@
+from collections import deque
+
+
+class Automaton(object):
+    """
+    Aho-Corasick automaton finding any of many patterns
+    inside a string in a single pass over its characters.
+
+    Example:
+        ``
+        >>> automaton = Automaton(['admin', 'support'])
+        >>> automaton.search('support-team')
+        'support'
+        >>> automaton.search('alice') is None
+        True
+        ``
+    """
+    def __init__(self, patterns):
+        # node 0 is the root, each node is described by its
+        # transitions, failure link and pattern reported there
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [None]
+        for pattern in patterns:
+            if pattern:
+                self._add(pattern)
+        self._link()
+
+    def _add(self, pattern):
+        node = 0
+        for char in pattern:
+            child = self.goto[node].get(char)
+            if child is None:
+                child = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(None)
+                self.goto[node][char] = child
+            node = child
+        if self.output[node] is None:
+            self.output[node] = pattern
+
+    def _link(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                if node:
+                    self.fail[child] = self.goto[fail].get(char, 0)
+                # report patterns which end inside a longer one
+                if self.output[child] is None:
+                    self.output[child] = self.output[self.fail[child]]
+
+    def search(self, text):
+        """
+        Return first pattern found in ``text`` or ``None``.
+        """
+        goto, fail, output = self.goto, self.fail, self.output
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node] is not None:
+                return output[node]
+        return None
@@ -1,15 +1,217 @@
+import asyncio
+import functools
+import inspect
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import _clean_credentials, _get_backends, get_user_model
 from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+from . import rehash
+from .coalesce import coalesced
 from .managers import UserManager
 
+DEFAULT_USER_CACHE_TIMEOUT = 3600
+
+_executor = None
+
+
+def get_executor():
+    """
+    Thread pool running blocking parts of authentication: user
+    queries and password hashing (hashlib releases the GIL while
+    hashing, so logins are hashed in parallel). Sized by
+    ``USERS_AUTH_EXECUTOR_WORKERS``, Python's default when unset.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'USERS_AUTH_EXECUTOR_WORKERS', None),
+            thread_name_prefix='users-auth',
+        )
+    return _executor
+
+
+@receiver(setting_changed)
+def reset_executor(**kwargs):
+    global _executor
+    if kwargs['setting'] == 'USERS_AUTH_EXECUTOR_WORKERS' and _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def _call_in_thread(func, *args, **kwargs):
+    # executor threads live outside the request cycle, so manage
+    # their connections as request_started/request_finished would
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def run_in_executor(func, *args, **kwargs):
+    """
+    Run blocking ``func`` in the authentication thread pool,
+    returning an awaitable result.
+    """
+    loop = asyncio.get_event_loop()
+    return loop.run_in_executor(get_executor(), functools.partial(_call_in_thread, func, *args, **kwargs))
+
+
+def _load_user_by_email(email):
+    UserModel = get_user_model()
+    try:
+        return UserModel._default_manager.get_for_authentication(email)
+    except UserModel.DoesNotExist:
+        return None
+
+
+def _load_user(user_id):
+    # full row: session users become ``request.user`` and each
+    # deferred field would cost another query when accessed
+    UserModel = get_user_model()
+    try:
+        return UserModel._default_manager.get(pk=user_id)
+    except UserModel.DoesNotExist:
+        return None
+
+
+def get_user_by_email(email):
+    """
+    Return user with ``email`` or ``None``. Concurrent
+    lookups of the same email share one query.
+    """
+    return coalesced(('email', email), lambda: _load_user_by_email(email))
+
+
+def get_user_by_pk(user_id):
+    return coalesced(('pk', user_id), lambda: _load_user(user_id))
+
 
 class EmailBackend(ModelBackend):
     """
     Authentication backend for email as USERNAME_FIELD.
-    We just normalize the email before authenticating.
+    We normalize the email before authenticating, and upgrade
+    outdated password hashes in background, see ``users.rehash``.
     """
     def authenticate(self, request, username=None, password=None, email=None, **kwargs):
+        UserModel = get_user_model()
         if email:
             username = email
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
         if username:
             username = UserManager.normalize_email(username)
-        return super(EmailBackend, self).authenticate(request, username, password, **kwargs)
+        user = get_user_by_email(username)
+        if user is None:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user.
+            UserModel().set_password(password)
+        elif rehash.check_password(user, password) and self.user_can_authenticate(user):
+            return user
+
+    def get_user(self, user_id):
+        user = get_user_by_pk(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    async def aauthenticate(self, request, username=None, password=None, email=None, **kwargs):
+        """
+        Asynchronous ``authenticate``. The user query and password
+        check run in the executor, so the event loop keeps serving
+        other logins meanwhile.
+        """
+        return await run_in_executor(
+            self.authenticate, request, username=username, password=password, email=email, **kwargs
+        )
+
+
+def get_user_cache():
+    return caches[getattr(settings, 'USERS_USER_CACHE', 'default')]
+
+
+def _version_key(user_id):
+    return 'users:user-version:%s' % user_id
+
+
+def _get_version(cache, user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), uuid.uuid4().hex, None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def invalidate_cached_user(user_id):
+    """
+    Make cached snapshots of user ``user_id`` unreachable. Versions
+    are random rather than counted, so a lost version key can't
+    resurrect a stale snapshot.
+    """
+    get_user_cache().set(_version_key(user_id), uuid.uuid4().hex, None)
+
+
+class CachedEmailBackend(EmailBackend):
+    """
+    EmailBackend which loads users of authenticated requests
+    from cache, so steady-state requests don't query the users table.
+
+    Snapshots are stored under the user's current version, which
+    ``users.signals`` replaces when a transaction saving or deleting
+    the user commits. Snapshots written by a request racing such a
+    save are stored under the old version and never read.
+
+    ``QuerySet.update()`` and ``UserManager.update_by_pk`` send no
+    signals, so call ``invalidate_cached_user`` after updating fields
+    which matter to authenticated requests with them. Hash upgrades
+    saved by bulk UPDATEs keep the version, which is fine as sessions
+    stay bound to the old hash, see ``users.rehash``.
+    """
+    def get_user(self, user_id):
+        cache = get_user_cache()
+        version = _get_version(cache, user_id)
+        key = 'users:user:%s:%s' % (user_id, version)
+        user = cache.get(key)
+        if user is None:
+            user = get_user_by_pk(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, getattr(settings, 'USERS_USER_CACHE_TIMEOUT', DEFAULT_USER_CACHE_TIMEOUT))
+        return user if self.user_can_authenticate(user) else None
+
+
+async def aauthenticate(request=None, **credentials):
+    """
+    Asynchronous ``django.contrib.auth.authenticate``. Backends are
+    tried in the same order and with the same outcome; those without
+    ``aauthenticate`` are run in the executor.
+    """
+    for backend, backend_path in _get_backends(return_tuples=True):
+        try:
+            inspect.getcallargs(backend.authenticate, request, **credentials)
+        except TypeError:
+            # This backend doesn't accept these credentials as arguments. Try the next one.
+            continue
+        try:
+            if hasattr(backend, 'aauthenticate'):
+                user = await backend.aauthenticate(request, **credentials)
+            else:
+                user = await run_in_executor(backend.authenticate, request, **credentials)
+        except PermissionDenied:
+            # This backend says to stop in our tracks - this user should not be allowed in at all.
+            break
+        if user is None:
+            continue
+        # Annotate the user object with the path of the backend.
+        user.backend = backend_path
+        return user
+
+    # The credentials supplied are invalid to all backends, fire signal
+    user_login_failed.send(sender=__name__, credentials=_clean_credentials(credentials), request=request)
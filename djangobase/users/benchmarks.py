@@ -0,0 +1,162 @@
+"""
+Benchmarks for validators, run with ``manage.py benchmark_validators``.
+
+Each benchmark calls a validator once per value of a generated
+corpus and records per-call latency, so we can report percentiles
+as well as throughput and compare them with a stored baseline.
+"""
+import json
+import random
+import string
+import time
+
+from django.core.exceptions import ValidationError
+
+from . import confusables, validators
+
+DOMAINS = ['gmail.com', 'o2.pl', 'wp.pl', 'onet.pl', 'interia.pl', 'example.com']
+IDN_DOMAINS = [u'żółw.pl', u'pocztа.pl', u'пример.рф', u'例え.jp', u'bücher.de', u'ελλάδα.gr']
+MIXED_LOCAL_PARTS = [u'pаypаl', u'gооgle', u'ρayρal', u'Alloρ', u'ΑlaskaJazz', u'admіn']
+UNICODE_LOCAL_PARTS = [u'łukasz', u'zażółć', u'иван', u'δοκιμή', u'müller', u'たなか']
+
+
+def _name(rnd, alphabet=string.ascii_lowercase + string.digits + '._'):
+    return ''.join(rnd.choice(alphabet) for _ in range(rnd.randint(4, 16)))
+
+
+def ascii_emails(count, seed=0):
+    rnd = random.Random(seed)
+    return [_name(rnd) + '@' + rnd.choice(DOMAINS) for _ in range(count)]
+
+
+def idn_emails(count, seed=0):
+    rnd = random.Random(seed)
+    return [
+        rnd.choice(UNICODE_LOCAL_PARTS + [_name(rnd)]) + '@' + rnd.choice(IDN_DOMAINS)
+        for _ in range(count)
+    ]
+
+
+def mixed_script_emails(count, seed=0):
+    rnd = random.Random(seed)
+    return [rnd.choice(MIXED_LOCAL_PARTS) + _name(rnd) + '@' + rnd.choice(DOMAINS) for _ in range(count)]
+
+
+def reserved_usernames(count, seed=0):
+    rnd = random.Random(seed)
+    names = list(validators.reserved_names.get().index.names)
+    return [
+        rnd.choice([rnd.choice(names), rnd.choice(names).upper(), _name(rnd)])
+        for _ in range(count)
+    ]
+
+
+CORPORA = {
+    'ascii': ascii_emails,
+    'idn': idn_emails,
+    'mixed': mixed_script_emails,
+    'reserved': reserved_usernames,
+}
+
+
+def _full_analysis(value):
+    """
+    Per-character analysis of both email parts, without fast path or cache.
+    """
+    local_part, domain = value.split('@')
+    return (confusables.is_dangerous(local_part) or confusables.is_dangerous(local_part.lower()) or
+            confusables.is_dangerous(domain) or confusables.is_dangerous(domain.lower()))
+
+
+_reserved_name = validators.ReservedNameValidator()
+_reserved_substring = validators.ReservedNameValidator(substring=True)
+
+# benchmark name: (callable, corpus name)
+BENCHMARKS = [
+    ('confusables_email/ascii', validators.validate_confusables_email, 'ascii'),
+    ('confusables_email_full/ascii', _full_analysis, 'ascii'),
+    ('confusables_email/idn', validators.validate_confusables_email, 'idn'),
+    ('confusables_email/mixed', validators.validate_confusables_email, 'mixed'),
+    ('disposable_email/ascii', validators.validate_disposable_email, 'ascii'),
+    ('confusables/reserved', validators.validate_confusables, 'reserved'),
+    ('reserved_name/reserved', _reserved_name, 'reserved'),
+    ('reserved_name_substring/reserved', _reserved_substring, 'reserved'),
+]
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(func, values, rounds=3):
+    """
+    Call ``func`` on each value ``rounds`` times, returning
+    latency percentiles in microseconds and calls per second.
+    """
+    timer = time.perf_counter
+    # warm up caches, lazily loaded tables and indexes
+    for value in values:
+        try:
+            func(value)
+        except ValidationError:
+            pass
+    latencies = []
+    started = timer()
+    for _ in range(rounds):
+        for value in values:
+            start = timer()
+            try:
+                func(value)
+            except ValidationError:
+                pass
+            latencies.append(timer() - start)
+    elapsed = timer() - started
+    latencies.sort()
+    return {
+        'p50': percentile(latencies, 0.50) * 1e6,
+        'p90': percentile(latencies, 0.90) * 1e6,
+        'p99': percentile(latencies, 0.99) * 1e6,
+        'ops': len(latencies) / elapsed,
+    }
+
+
+def run(count=10000, rounds=3, seed=0, only=None):
+    """
+    Run benchmarks whose name contains ``only`` (all by default),
+    returning ``{name: results}``.
+    """
+    corpora = {}
+    results = {}
+    for name, func, corpus in BENCHMARKS:
+        if only and only not in name:
+            continue
+        if corpus not in corpora:
+            corpora[corpus] = CORPORA[corpus](count, seed)
+        results[name] = measure(func, corpora[corpus], rounds)
+    return results
+
+
+def compare(results, baseline, tolerance=0.2, metric='p50'):
+    """
+    Return list of ``(name, baseline, current)`` for benchmarks whose
+    ``metric`` latency grew by more than ``tolerance`` over baseline.
+    """
+    regressions = []
+    for name, current in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name][metric], current[metric]
+        if after > before * (1 + tolerance):
+            regressions.append((name, before, after))
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
@@ -0,0 +1,253 @@
+"""
+Compact, memory-mapped blocklist of email domains.
+
+Domains are stored as sorted 64-bit fingerprints with a radix index
+on their top bits (one bucket per fingerprint, up to 2**16 buckets),
+so lookup is one index read plus a binary search over a couple
+of entries, and 100k domains take about 1MB:
+
+    header | source version | radix offsets | fingerprints
+
+The table is built from a plain text list (one domain per line,
+'#' starts a comment) with ``manage.py build_domain_blocklist``
+and mapped read-only on first use, so forked workers share its pages.
+If it is missing we index the text list in memory instead. Running
+workers pick up a rebuilt table or edited list without restart,
+see ``users.reloading``.
+"""
+import bisect
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .reloading import ReloadableData
+
+DATAFILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'datafiles')
+DEFAULT_DISPOSABLE_DOMAINS_SOURCE = os.path.join(DATAFILES_DIR, 'disposable_domains.txt')
+DEFAULT_DISPOSABLE_DOMAINS_TABLE = os.path.join(DATAFILES_DIR, 'disposable_domains.bin')
+
+MAGIC = b'UDBL'
+FORMAT_VERSION = 1
+# magic, format version, radix bits, fingerprints count, source version length
+HEADER = struct.Struct('<4sHHII')
+MAX_RADIX_BITS = 16
+
+
+class BlocklistError(Exception):
+    pass
+
+
+def _align(offset, size=8):
+    return offset + (-offset % size)
+
+
+def normalize_domain(domain):
+    """
+    Lowercase ``domain``, drop trailing dot and encode it
+    with IDNA, so unicode and punycode spellings match.
+    """
+    domain = domain.strip().lower().rstrip('.')
+    try:
+        # most domains are ASCII, which IDNA leaves as it is
+        # but takes several times longer to find out
+        return domain.encode('ascii')
+    except UnicodeEncodeError:
+        pass
+    try:
+        return domain.encode('idna')
+    except UnicodeError:
+        return domain.encode('utf-8')
+
+
+def fingerprint(domain):
+    """
+    64-bit fingerprint of normalized ``domain``: CRC32 of the
+    name and of the name reversed, which are cheap to compute.
+    """
+    return zlib.crc32(domain) << 32 | zlib.crc32(domain[::-1])
+
+
+def parent_domains(domain):
+    """
+    Yield normalized ``domain`` and all its parent domains,
+    e.g. b'a.b.com', b'b.com', b'com'.
+    """
+    while domain:
+        yield domain
+        _, _, domain = domain.partition(b'.')
+
+
+def read_domains(path):
+    """
+    Yield normalized domains listed in text file at ``path``.
+    """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                yield normalize_domain(line)
+
+
+def source_version(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+
+def _radix_bits(count):
+    return max(0, min(MAX_RADIX_BITS, count.bit_length() - 1))
+
+
+def _index(domains):
+    fingerprints = array('Q', sorted(set(fingerprint(d) for d in domains)))
+    bits = _radix_bits(len(fingerprints))
+    offsets = array('I', bytes(4 * ((1 << bits) + 1)))
+    shift = 64 - bits
+    for fp in fingerprints:
+        offsets[(fp >> shift) + 1] += 1
+    for i in range(1, len(offsets)):
+        offsets[i] += offsets[i - 1]
+    return bits, offsets, fingerprints
+
+
+def build_blocklist(source, path):
+    """
+    Compile text list at ``source`` into binary table at ``path``.
+    The file is replaced atomically.
+    """
+    bits, offsets, fingerprints = _index(read_domains(source))
+    version = source_version(source).encode('ascii')
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+        fingerprints.byteswap()
+
+    blob = HEADER.pack(MAGIC, FORMAT_VERSION, bits, len(fingerprints), len(version)) + version
+    blob += b'\0' * (_align(len(blob)) - len(blob))
+    blob += offsets.tobytes()
+    blob += b'\0' * (_align(len(blob)) - len(blob))
+    blob += fingerprints.tobytes()
+
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(blob)
+    os.replace(tmp_path, path)
+    return path
+
+
+class DomainBlocklist(object):
+    """
+    Set-like view over sorted domain fingerprints.
+    """
+    def __init__(self, bits, offsets, fingerprints, version=''):
+        self.offsets = offsets
+        self.fingerprints = fingerprints
+        self.version = version
+        self._shift = 64 - bits
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    @classmethod
+    def from_domains(cls, domains, version=''):
+        return cls(*_index(normalize_domain(d) for d in domains), version=version)
+
+    @classmethod
+    def from_source(cls, path):
+        return cls(*_index(read_domains(path)), version=source_version(path))
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'rb') as f:
+            buf = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        try:
+            magic, version, bits, count, version_len = HEADER.unpack_from(buf)
+        except struct.error:
+            raise BlocklistError('%s is truncated' % path)
+        if magic != MAGIC or version != FORMAT_VERSION or bits > MAX_RADIX_BITS:
+            raise BlocklistError('%s is not a domain blocklist' % path)
+        offset = HEADER.size
+        source = bytes(buf[offset:offset + version_len]).decode('ascii')
+        offset = _align(offset + version_len)
+        offsets_size = 4 * ((1 << bits) + 1)
+        offset_end = _align(offset + offsets_size)
+        if offset_end + 8 * count != len(buf):
+            raise BlocklistError('%s has unexpected size' % path)
+        offsets = buf[offset:offset + offsets_size]
+        fingerprints = buf[offset_end:]
+        if sys.byteorder == 'little':
+            offsets, fingerprints = offsets.cast('I'), fingerprints.cast('Q')
+        else:
+            offsets, fingerprints = array('I', bytes(offsets)), array('Q', bytes(fingerprints))
+            offsets.byteswap()
+            fingerprints.byteswap()
+        return cls(bits, offsets, fingerprints, source)
+
+    def _contains(self, domain):
+        fp = fingerprint(domain)
+        bucket = fp >> self._shift
+        lo, hi = self.offsets[bucket], self.offsets[bucket + 1]
+        i = bisect.bisect_left(self.fingerprints, fp, lo, hi)
+        return i < hi and self.fingerprints[i] == fp
+
+    def __contains__(self, domain):
+        return self._contains(normalize_domain(domain))
+
+    def match(self, domain):
+        """
+        Return ``domain`` or its parent domain found on
+        the blocklist, or ``None``.
+        """
+        for candidate in parent_domains(normalize_domain(domain)):
+            if self._contains(candidate):
+                return candidate.decode('ascii', 'replace')
+        return None
+
+
+def load_blocklist(path, source):
+    """
+    Map compiled table at ``path``, falling back to indexing
+    text list at ``source`` in memory if the table is missing
+    or was built from another version of the list.
+    """
+    try:
+        table = DomainBlocklist.from_file(path)
+    except (OSError, ValueError, BlocklistError):
+        return DomainBlocklist.from_source(source)
+    try:
+        if os.stat(source).st_mtime > os.stat(path).st_mtime and \
+                source_version(source) != table.version:
+            return DomainBlocklist.from_source(source)
+    except OSError:
+        pass
+    return table
+
+
+def get_disposable_domains_paths():
+    return [
+        getattr(settings, 'USERS_DISPOSABLE_DOMAINS_TABLE', DEFAULT_DISPOSABLE_DOMAINS_TABLE),
+        getattr(settings, 'USERS_DISPOSABLE_DOMAINS_SOURCE', DEFAULT_DISPOSABLE_DOMAINS_SOURCE),
+    ]
+
+
+# Re-mapped in the background when the table or its source changes.
+disposable_domains = ReloadableData(
+    paths=get_disposable_domains_paths,
+    loader=lambda: load_blocklist(*get_disposable_domains_paths()),
+)
+
+
+def get_disposable_domains():
+    return disposable_domains.get()
+
+
+@receiver(setting_changed)
+def reset_disposable_domains(**kwargs):
+    if kwargs['setting'] in ('USERS_DISPOSABLE_DOMAINS_TABLE', 'USERS_DISPOSABLE_DOMAINS_SOURCE'):
+        disposable_domains.reset()
@@ -0,0 +1,59 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Small thread-safe least-recently-used cache.
+    Keeps at most ``maxsize`` entries and counts hits
+    and misses so it can be inspected in production.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def size(self):
+        return len(self._data)
+
+    def get_or_set(self, key, func):
+        """
+        Return cached value for ``key``, calling ``func(key)``
+        and storing its result if it is missing.
+        """
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return value
+        value = func(key)
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
@@ -0,0 +1,139 @@
+"""
+Coalescing of concurrent identical lookups ("single flight").
+
+When many requests miss the cache for the same user at once, e.g.
+after a deploy, only one of them queries the database and the others
+wait for its result. Within a process callers wait on an event.
+Optionally, across workers the first one takes a lock in a shared
+cache and publishes its result there:
+
+    USERS_COALESCE_CACHE = None  # cache alias, None coalesces only in-process
+    USERS_COALESCE_TIMEOUT = 2   # seconds to wait for another worker
+
+Sharing costs every lookup a few cache round trips and puts results,
+i.e. user rows with password hashes, into that cache, so it's off
+by default.
+
+Results are only handed to callers which arrived while the lookup
+was running, so coalescing never returns older data than a query
+started at that moment would.
+"""
+import copy
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULT_TIMEOUT = 2
+POLL_INTERVAL = 0.01
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+
+    def __init__(self):
+        self.stats = {'calls': 0, 'coalesced': 0, 'shared': 0}
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_cache():
+        alias = getattr(settings, 'USERS_COALESCE_CACHE', None)
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def get_timeout():
+        return getattr(settings, 'USERS_COALESCE_TIMEOUT', DEFAULT_TIMEOUT)
+
+    @staticmethod
+    def get_lock_key(key):
+        return 'users:flight:%s' % hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+    def do(self, key, func):
+        """
+        Return ``func()``, unless a call with the same ``key`` is
+        already running, in which case wait and return its result.
+        Exceptions are raised to all waiting callers.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            self.stats['coalesced'] += 1
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            # callers may modify returned objects
+            return copy.deepcopy(call.result)
+        try:
+            call.result = self._call_shared(key, func)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def _call_shared(self, key, func):
+        cache = self.get_cache()
+        if cache is None:
+            self.stats['calls'] += 1
+            return func()
+        lock_key = self.get_lock_key(key)
+        timeout = self.get_timeout()
+        token = uuid.uuid4().hex
+        acquired = cache.add(lock_key, token, timeout)
+        if not acquired:
+            result = self._wait(cache, lock_key, timeout)
+            if result is not None:
+                self.stats['shared'] += 1
+                return result[0]
+        self.stats['calls'] += 1
+        try:
+            value = func()
+            if acquired:
+                cache.set('users:flight-result:%s' % token, (value,), timeout)
+        finally:
+            if acquired and cache.get(lock_key) == token:
+                cache.delete(lock_key)
+        return value
+
+    def _wait(self, cache, lock_key, timeout):
+        """
+        Wait for result of the lookup holding ``lock_key`` in
+        another worker. Returns ``(result,)`` or ``None`` if it
+        failed or took too long.
+        """
+        token = cache.get(lock_key)
+        if token is None:
+            return None
+        result_key = 'users:flight-result:%s' % token
+        deadline = time.monotonic() + timeout
+        while True:
+            found = cache.get_many([result_key, lock_key])
+            if result_key in found:
+                return found[result_key]
+            if found.get(lock_key) != token or time.monotonic() >= deadline:
+                return None
+            time.sleep(POLL_INTERVAL)
+
+
+user_lookups = SingleFlight()
+
+
+def coalesced(key, func):
+    return user_lookups.do(key, func)
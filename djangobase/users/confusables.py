@@ -0,0 +1,357 @@
+"""
+Compact, memory-mapped replacement for ``confusable_homoglyphs``
+lookups used by our validators.
+
+``confusable_homoglyphs`` parses two large JSON files into dicts
+when imported, which every worker process pays for. Its verdict
+for ``is_dangerous`` only depends on the script alias of each
+character and on whether the character has any homoglyphs, so we
+compile exactly that, plus the prototype of each confusable
+character used by ``skeleton``, into a binary file of sorted arrays:
+
+    header | alias names | source version | range starts | range ends
+           | confusable code points | range aliases
+           | prototype code points | prototype offsets | prototypes
+
+Lookups are binary searches over the mapped file, so forked workers
+share the same pages. The table is built with
+``manage.py build_confusables_table`` and loaded on first use.
+If it is missing or was built from another ``confusable_homoglyphs``
+version we fall back to the library itself.
+"""
+import bisect
+import mmap
+import os
+import struct
+import sys
+import threading
+import unicodedata
+from array import array
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'datafiles', 'confusables.bin')
+
+MAGIC = b'UCNF'
+FORMAT_VERSION = 2
+# magic, format version, aliases count, ranges count, confusables count,
+# alias names length, source version length, prototypes count, prototypes length
+HEADER = struct.Struct('<4sHHIIIIII')
+
+COMMON = 'COMMON'
+LATIN = 'LATIN'
+UNKNOWN = 'Unknown'
+
+# Strings made only of characters below this one can't be mixed-script.
+ASCII_LIMIT = '\x80'
+
+
+class TableError(Exception):
+    pass
+
+
+def _align(offset, size=4):
+    return offset + (-offset % size)
+
+
+def _source_version():
+    import confusable_homoglyphs
+    return confusable_homoglyphs.__version__
+
+
+def get_table_path():
+    return getattr(settings, 'USERS_CONFUSABLES_TABLE', DEFAULT_TABLE_PATH)
+
+
+def prototypes(confusables_data):
+    """
+    Map each confusable character to its prototype, as defined
+    by Unicode confusables.txt, e.g. cyrillic 'а' to latin 'a'
+    and 'm' to 'rn'. Characters which are prototypes are skipped.
+
+    ``confusable_homoglyphs`` keeps the mapping in both directions:
+    a character maps to its prototype only, while a prototype maps
+    to all of its confusables.
+    """
+    result = {}
+    for char, homoglyphs in confusables_data.items():
+        if len(char) != 1 or len(homoglyphs) != 1:
+            continue
+        prototype = homoglyphs[0]['c']
+        if len(prototype) == 1 and len(confusables_data.get(prototype, ())) == 1:
+            # two characters only confusable with each other,
+            # pick the lower one as prototype
+            if ord(char) < ord(prototype):
+                continue
+        result[char] = prototype
+    return result
+
+
+def build_table(path):
+    """
+    Compile ``confusable_homoglyphs`` data into binary table at ``path``.
+    The file is replaced atomically, so running workers keep
+    their old mapping until they reload.
+    """
+    from confusable_homoglyphs import categories, confusables
+
+    data = categories.categories_data
+    aliases = list(data['iso_15924_aliases']) + [UNKNOWN]
+
+    # scripts only matter for our verdict, so merge
+    # adjacent ranges which differ only by category
+    ranges = []
+    for start, end, alias, _ in data['code_points_ranges']:
+        if ranges and ranges[-1][1] + 1 == start and ranges[-1][2] == alias:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end, alias])
+
+    code_points = sorted(
+        ord(char) for char, homoglyphs in confusables.confusables_data.items()
+        if len(char) == 1 and homoglyphs
+    )
+
+    mapping = sorted(prototypes(confusables.confusables_data).items())
+    prototype_keys = array('I', (ord(char) for char, _ in mapping))
+    prototype_offsets = array('I', [0])
+    encoded = []
+    for _, prototype in mapping:
+        encoded.append(prototype.encode('utf-8'))
+        prototype_offsets.append(prototype_offsets[-1] + len(encoded[-1]))
+    encoded = b''.join(encoded)
+
+    names = '\n'.join(aliases).encode('ascii')
+    source = _source_version().encode('ascii')
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, len(aliases), len(ranges),
+        len(code_points), len(names), len(source),
+        len(prototype_keys), len(encoded),
+    )
+    starts = array('I', (r[0] for r in ranges))
+    ends = array('I', (r[1] for r in ranges))
+    confusable = array('I', code_points)
+    alias_ids = array('H', (r[2] for r in ranges))
+    if sys.byteorder != 'little':
+        for a in (starts, ends, confusable, alias_ids, prototype_keys, prototype_offsets):
+            a.byteswap()
+
+    blob = header + names + source
+    blob += b'\0' * (_align(len(blob)) - len(blob))
+    blob += starts.tobytes() + ends.tobytes() + confusable.tobytes() + alias_ids.tobytes()
+    blob += b'\0' * (_align(len(blob)) - len(blob))
+    blob += prototype_keys.tobytes() + prototype_offsets.tobytes() + encoded
+
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(blob)
+    os.replace(tmp_path, path)
+    return path
+
+
+class ConfusablesTable(object):
+    """
+    Read-only view of a compiled confusables table.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+        try:
+            (magic, version, n_aliases, n_ranges, n_confusables,
+             names_len, source_len, n_prototypes, prototypes_len) = HEADER.unpack_from(buf)
+        except struct.error:
+            raise TableError('%s is truncated' % path)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise TableError('%s is not a confusables table' % path)
+
+        offset = HEADER.size
+        self.aliases = bytes(buf[offset:offset + names_len]).decode('ascii').split('\n')
+        offset += names_len
+        self.source_version = bytes(buf[offset:offset + source_len]).decode('ascii')
+        offset = _align(offset + source_len)
+
+        self.starts, offset = self._array(buf, offset, 'I', n_ranges)
+        self.ends, offset = self._array(buf, offset, 'I', n_ranges)
+        self.confusable, offset = self._array(buf, offset, 'I', n_confusables)
+        self.alias_ids, offset = self._array(buf, offset, 'H', n_ranges)
+        offset = _align(offset)
+        self.prototype_keys, offset = self._array(buf, offset, 'I', n_prototypes)
+        self.prototype_offsets, offset = self._array(buf, offset, 'I', n_prototypes + 1)
+        self.prototypes = buf[offset:offset + prototypes_len]
+        offset += prototypes_len
+        if offset != len(buf):
+            raise TableError('%s has unexpected size' % path)
+
+        self.common_id = self.aliases.index(COMMON)
+        self.unknown_id = self.aliases.index(UNKNOWN)
+        self.single_script_limit = chr(self._single_script_limit())
+
+    @staticmethod
+    def _array(buf, offset, typecode, count):
+        size = array(typecode).itemsize * count
+        chunk = buf[offset:offset + size]
+        if len(chunk) != size:
+            raise TableError('confusables table is truncated')
+        if sys.byteorder == 'little':
+            values = chunk.cast(typecode)
+        else:
+            values = array(typecode, bytes(chunk))
+            values.byteswap()
+        return values, offset + size
+
+    def _single_script_limit(self):
+        """
+        First code point which is neither Latin nor Common.
+        Everything below it (ASCII, Latin-1, Latin Extended-A and B)
+        belongs to one script, ignoring Common.
+        """
+        allowed = (self.aliases.index(LATIN), self.common_id)
+        limit = 0
+        for start, end, alias in zip(self.starts, self.ends, self.alias_ids):
+            if start != limit or alias not in allowed:
+                break
+            limit = end + 1
+        return limit
+
+    def alias_id(self, code_point):
+        i = bisect.bisect_right(self.starts, code_point) - 1
+        if i >= 0 and code_point <= self.ends[i]:
+            return self.alias_ids[i]
+        return self.unknown_id
+
+    def alias(self, char):
+        return self.aliases[self.alias_id(ord(char))]
+
+    def is_mixed_script(self, string):
+        common = self.common_id
+        first = None
+        for char in string:
+            alias = self.alias_id(ord(char))
+            if alias == common:
+                continue
+            if first is None:
+                first = alias
+            elif alias != first:
+                return True
+        return False
+
+    def is_confusable(self, string):
+        confusable = self.confusable
+        size = len(confusable)
+        for char in string:
+            code_point = ord(char)
+            i = bisect.bisect_left(confusable, code_point)
+            if i < size and confusable[i] == code_point:
+                return True
+        return False
+
+    def is_dangerous(self, string):
+        """
+        Same verdict as ``confusable_homoglyphs.confusables.is_dangerous``.
+        """
+        return self.is_mixed_script(string) and self.is_confusable(string)
+
+    def prototype(self, char):
+        keys = self.prototype_keys
+        code_point = ord(char)
+        i = bisect.bisect_left(keys, code_point)
+        if i < len(keys) and keys[i] == code_point:
+            start, end = self.prototype_offsets[i], self.prototype_offsets[i + 1]
+            return bytes(self.prototypes[start:end]).decode('utf-8')
+        return char
+
+
+class LibraryTable(object):
+    """
+    Fallback which asks ``confusable_homoglyphs`` directly.
+    """
+    single_script_limit = ASCII_LIMIT
+
+    def __init__(self):
+        from confusable_homoglyphs import confusables
+        self._confusables = confusables
+        self._prototypes = prototypes(confusables.confusables_data)
+
+    def is_dangerous(self, string):
+        return bool(self._confusables.is_dangerous(string))
+
+    def prototype(self, char):
+        return self._prototypes.get(char, char)
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def load_table(path=None):
+    """
+    Map compiled table, falling back to ``LibraryTable``
+    if it is missing, corrupted or out of date.
+    """
+    try:
+        table = ConfusablesTable(path or get_table_path())
+    except (OSError, ValueError, TableError):
+        return LibraryTable()
+    if table.source_version != _source_version():
+        return LibraryTable()
+    return table
+
+
+def get_table():
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = load_table()
+    return _table
+
+
+@receiver(setting_changed)
+def reset_table(**kwargs):
+    global _table
+    if kwargs['setting'] == 'USERS_CONFUSABLES_TABLE':
+        _table = None
+
+
+def cannot_be_mixed_script(string):
+    """
+    Cheap pre-check, True if ``string`` and its lowercased form
+    only use characters below ``single_script_limit`` (e.g. pure ASCII),
+    so they can't be mixed-script and can't be dangerous.
+    """
+    limit = get_table().single_script_limit
+    # lowercasing can leave the limit, e.g. 'İ' becomes 'i' + U+0307
+    return not string or (max(string) < limit and max(string.lower()) < limit)
+
+
+def is_dangerous(string):
+    return get_table().is_dangerous(string)
+
+
+def get_ascii_translation(table):
+    """
+    ``str.translate`` table mapping ASCII characters to their
+    prototypes in ``table``, built once per table.
+    """
+    translation = getattr(table, '_ascii_translation', None)
+    if translation is None:
+        translation = table._ascii_translation = {i: table.prototype(chr(i)) for i in range(ord(ASCII_LIMIT))}
+    return translation
+
+
+def skeleton(string):
+    """
+    UTS #39 skeleton of ``string``: strings which look
+    the same have the same skeleton, e.g. 'pаypаl' (cyrillic 'а')
+    and 'paypal', or 'rnail' and 'mail'.
+    """
+    table = get_table()
+    if not string or max(string) < ASCII_LIMIT:
+        # most emails; ASCII is already NFD
+        return unicodedata.normalize('NFD', string.translate(get_ascii_translation(table)))
+    prototype = table.prototype
+    string = unicodedata.normalize('NFD', string)
+    return unicodedata.normalize('NFD', ''.join(prototype(char) for char in string))
@@ -132,7 +132,7 @@ OTHER_SENSITIVE_NAMES = [
     'pricing',
     'privacy',
     'profile',
-    'register'
+    'register',
     'secure',
     'settings',
     'signin',
@@ -143,12 +143,21 @@ OTHER_SENSITIVE_NAMES = [
     'terms',
     'tos',
     'user',
-    'users'
+    'users',
     'weblog',
     'work',
 ]
 
 
+# ReservedNameValidator reads these names from datafiles/reserved_names.txt
+# (also when only custom names or prefixes are given), so they can be
+# changed without restarting workers. Keep both in sync, tests check it.
 DEFAULT_RESERVED_NAMES = (SPECIAL_HOSTNAMES + PROTOCOL_HOSTNAMES +
                           CA_ADDRESSES + RFC_2142 + NOREPLY_ADDRESSES +
                           SENSITIVE_FILENAMES + OTHER_SENSITIVE_NAMES)
+
+
+DEFAULT_RESERVED_PREFIXES = [
+    # Prefixes reserving a whole namespace of names.
+    '.well-known',  # https://tools.ietf.org/html/rfc5785
+]
@@ -6,6 +6,8 @@ from django.contrib.auth.forms import UserCreationForm
 from django.utils.text import gettext_lazy as _
 from .managers import BaseUserManager
 from . import validators
+from .auth import aauthenticate
+from .throttle import login_throttle
 from django.contrib.auth.forms import PasswordResetForm
 UserModel = get_user_model()
 
@@ -21,23 +23,52 @@ class RegistrationForm(UserCreationForm):
     default_error_messages = {
         'reserved_name': 'To imie nie może zostac uzyte.',
         'confusable_value': 'Ta wartosc nie moza zostac uzyta.',
-        'confusable_email': 'Ten email nie moze zostac uzyty.'
+        'confusable_email': 'Ten email nie moze zostac uzyty.',
+        'disposable_email': 'Ten email nie moze zostac uzyty.',
+        'lookalike_email': 'Ten email nie moze zostac uzyty.',
+        'duplicate_email': 'Ten email jest juz zajety.',
     }
 
     email = forms.EmailField(
         required=True,
-        validators=[validators.validate_confusables_email]
+        validators=[
+            validators.validate_confusables_email,
+            validators.validate_disposable_email,
+        ]
     )
 
     class Meta(UserCreationForm.Meta):
         model = UserModel
         fields = ['email', 'password1', 'password2']
 
+    def clean_email(self):
+        """
+        Reject emails which differ from email of existing user only
+        in case, or look the same, e.g. with cyrillic 'а' instead of
+        latin 'a'. Exact duplicates are reported by unique validation.
+        """
+        email = self.cleaned_data['email']
+        if UserModel._default_manager.filter_by_email(email).exclude(email=email).exists():
+            raise forms.ValidationError(
+                self.default_error_messages['duplicate_email'],
+                code='duplicate_email',
+            )
+        lookalikes = UserModel._default_manager.filter(
+            email_skeleton=UserModel.get_email_skeleton(email),
+        ).exclude(email=email)
+        if lookalikes.exists():
+            raise forms.ValidationError(
+                self.default_error_messages['lookalike_email'],
+                code='lookalike_email',
+            )
+        return email
+
 
 class AuthenticationForm(forms.Form):
     error_messages = {
         'invalid_login': _("Please enter a correct %(email)s and password. Note that both "
-                           "fields may be case-sensitive.")
+                           "fields may be case-sensitive."),
+        'throttled': _("Too many login attempts. Please try again later."),
     }
 
     email = forms.EmailField(
@@ -57,17 +88,71 @@ class AuthenticationForm(forms.Form):
         """
         self.request = request
         self.user_cache = None
+        self.defer_authentication = False
         super().__init__(*args, **kwargs)
 
+    def get_invalid_login_error(self):
+        return forms.ValidationError(
+            self.error_messages['invalid_login'],
+            code='invalid_login',
+        )
+
+    def check_throttle(self, email):
+        """
+        Reject attempts over limits of ``users.throttle``
+        before any password is hashed.
+        """
+        if login_throttle.attempt(self.request, email) is not None:
+            raise forms.ValidationError(self.error_messages['throttled'], code='throttled')
+
+    def record_login(self, email):
+        """
+        Attempts count as failed logins from ``check_throttle`` on,
+        successful one is given back and resets the count of ``email``.
+        """
+        if self.user_cache is not None:
+            login_throttle.success(self.request, email)
+
     def clean(self):
         email = self.cleaned_data.get('email')
         password = self.cleaned_data.get('password')
 
-        if email is not None and password:
+        if email is not None and password and not self.defer_authentication:
+            self.check_throttle(email)
             self.user_cache = authenticate(self.request, username=email, password=password)
+            self.record_login(email)
             if self.user_cache is None:
-                raise forms.ValidationError(
-                    self.error_messages['invalid_login'],
-                    code='invalid_login',
-                )
+                raise self.get_invalid_login_error()
         return self.cleaned_data
+
+    async def aclean(self):
+        """
+        Asynchronous counterpart of the authentication done in ``clean``.
+        """
+        email = self.cleaned_data.get('email')
+        password = self.cleaned_data.get('password')
+
+        if email is not None and password:
+            self.check_throttle(email)
+            self.user_cache = await aauthenticate(self.request, username=email, password=password)
+            self.record_login(email)
+            if self.user_cache is None:
+                raise self.get_invalid_login_error()
+        return self.cleaned_data
+
+    async def ais_valid(self):
+        """
+        Asynchronous ``is_valid``: fields are cleaned synchronously,
+        as they don't block, then credentials are checked with ``aclean``.
+        """
+        self.defer_authentication = True
+        try:
+            if not self.is_valid():
+                return False
+        finally:
+            self.defer_authentication = False
+        try:
+            await self.aclean()
+        except forms.ValidationError as e:
+            self.add_error(None, e)
+        return not self.errors
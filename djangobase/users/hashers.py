@@ -0,0 +1,75 @@
+"""
+Password hashers with work factors tuned for our hardware, see
+``manage.py calibrate_hashers``, and hashers wrapping weak legacy
+hashes, see ``manage.py upgrade_password_hashes``.
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import MD5PasswordHasher, PBKDF2PasswordHasher, SHA1PasswordHasher
+
+
+class CalibratedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 with iterations read from ``USERS_PBKDF2_ITERATIONS``.
+
+    The algorithm name is unchanged, so hashes made by Django's
+    PBKDF2PasswordHasher still verify, and are upgraded to the
+    calibrated iterations on next login. Use it as the first
+    entry of ``PASSWORD_HASHERS``.
+    """
+    @property
+    def iterations(self):
+        return getattr(settings, 'USERS_PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+
+class WrappedPasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 over the hash of a weaker ``inner_hasher``, as in
+    https://docs.djangoproject.com/en/2.0/topics/auth/passwords/#password-upgrading-without-requiring-a-login
+
+    Lets us strengthen old hashes without knowing passwords,
+    see ``manage.py upgrade_password_hashes``. Users' next login
+    upgrades them to the preferred hasher as usual.
+    """
+    inner_hasher = None
+
+    def encode_inner_hash(self, inner_hash, salt, iterations=None):
+        return super(WrappedPasswordHasher, self).encode(inner_hash, salt, iterations)
+
+    def encode(self, password, salt, iterations=None):
+        _, _, inner_hash = self.inner_hasher().encode(password, salt).split('$', 2)
+        return self.encode_inner_hash(inner_hash, salt, iterations)
+
+    def wrap(self, encoded):
+        """
+        Return wrapped version of ``inner_hasher``'s ``encoded`` hash.
+        """
+        algorithm, salt, inner_hash = encoded.split('$', 2)
+        assert algorithm == self.inner_hasher.algorithm
+        return self.encode_inner_hash(inner_hash, salt)
+
+
+class PBKDF2WrappedSHA1PasswordHasher(WrappedPasswordHasher):
+    algorithm = 'pbkdf2_wrapped_sha1'
+    inner_hasher = SHA1PasswordHasher
+
+
+class PBKDF2WrappedMD5PasswordHasher(WrappedPasswordHasher):
+    algorithm = 'pbkdf2_wrapped_md5'
+    inner_hasher = MD5PasswordHasher
+
+
+WRAPPED_HASHERS = {
+    hasher.inner_hasher.algorithm: hasher
+    for hasher in [PBKDF2WrappedSHA1PasswordHasher, PBKDF2WrappedMD5PasswordHasher]
+}
+
+
+def wrap_hash(encoded):
+    """
+    Wrap ``encoded`` hash with the matching wrapped hasher,
+    return ``None`` if it isn't made by a hasher we can wrap.
+    """
+    algorithm = encoded.split('$', 1)[0]
+    if algorithm not in WRAPPED_HASHERS:
+        return None
+    return WRAPPED_HASHERS[algorithm]().wrap(encoded)
@@ -0,0 +1,216 @@
+"""
+Password hashing offloaded to a pool of worker processes.
+
+Hashing a password takes tens of milliseconds of CPU, during which
+the request thread holds the GIL and other requests served by the
+same process wait. With ``USERS_HASHING_POOL_SIZE`` set, passwords
+are hashed and verified by worker processes instead:
+
+    USERS_HASHING_POOL_SIZE = 2     # worker processes, 0 hashes inline
+    USERS_HASHING_QUEUE_SIZE = 64   # hashes waiting or running in the pool
+    USERS_HASHING_TIMEOUT = 5       # seconds to wait for a worker
+
+When the queue is full, a worker doesn't answer within the timeout
+or the pool breaks, the password is hashed inline, so hashing is
+never refused. Workers are forked from the web process, so they see
+the same ``PASSWORD_HASHERS``.
+
+Bulk operations, e.g. ``UserManager.bulk_create_users``, hash many
+passwords at once with ``make_passwords`` in a separate pool:
+
+    USERS_HASHING_BATCH_WORKERS = None  # worker processes, None for all CPUs, 0 hashes inline
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 0
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_TIMEOUT = 5
+# passwords sent to a batch worker at once
+BATCH_CHUNKSIZE = 8
+
+
+def _setup():
+    # workers started with 'spawn' import a fresh Django
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        django.setup()
+
+
+def _make_password(password):
+    _setup()
+    return hashers.make_password(password)
+
+
+def _check_password(password, encoded):
+    """
+    Return whether ``password`` matches ``encoded`` and whether
+    ``encoded`` should be upgraded to the preferred hasher.
+    """
+    _setup()
+    must_update = []
+    is_correct = hashers.check_password(password, encoded, must_update.append)
+    return is_correct, bool(must_update)
+
+
+class HashingService(object):
+    """
+    Runs ``make_password`` and ``check_password`` in ``pool_size``
+    worker processes, with at most ``queue_size`` hashes submitted
+    at once, each given ``timeout`` seconds.
+    """
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, queue_size=DEFAULT_QUEUE_SIZE, timeout=DEFAULT_TIMEOUT):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.stats = {'pool': 0, 'inline': 0, 'queue_full': 0, 'timeout': 0, 'broken': 0}
+        self._slots = threading.BoundedSemaphore(queue_size) if queue_size > 0 else None
+        self._pool = None
+        self._lock = threading.Lock()
+        # requests hash in many threads, += isn't atomic
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.pool_size)
+            return self._pool
+
+    def _run(self, func, *args):
+        if self.pool_size <= 0:
+            self._count('inline')
+            return func(*args)
+        if self._slots is None or not self._slots.acquire(blocking=False):
+            self._count('queue_full')
+            return self._inline(func, *args)
+        try:
+            pool = self._get_pool()
+            future = pool.submit(func, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            return self._broken(pool, func, *args)
+        # the slot is held until the worker is done, also when we
+        # stop waiting for it, so the queue bound holds under load
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            result = future.result(timeout=self.timeout)
+        except TimeoutError:
+            self._count('timeout')
+            logger.warning('Password hashing timed out in worker, hashing inline.')
+            return self._inline(func, *args)
+        except BrokenProcessPool:
+            return self._broken(pool, func, *args)
+        self._count('pool')
+        return result
+
+    def _broken(self, pool, func, *args):
+        self._count('broken')
+        logger.exception('Password hashing pool is broken, restarting it.')
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        return self._inline(func, *args)
+
+    def _inline(self, func, *args):
+        self._count('inline')
+        return func(*args)
+
+    def make_password(self, password):
+        if password is None:
+            # unusable password, nothing to hash
+            return hashers.make_password(None)
+        return self._run(_make_password, password)
+
+    def check_password(self, password, encoded, setter=None):
+        """
+        Same as ``django.contrib.auth.hashers.check_password``,
+        ``setter`` is called in this process.
+        """
+        if password is None or not hashers.is_password_usable(encoded):
+            return False
+        is_correct, must_update = self._run(_check_password, password, encoded)
+        if setter and is_correct and must_update:
+            setter(password)
+        return is_correct
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = HashingService(
+                    pool_size=getattr(settings, 'USERS_HASHING_POOL_SIZE', DEFAULT_POOL_SIZE),
+                    queue_size=getattr(settings, 'USERS_HASHING_QUEUE_SIZE', DEFAULT_QUEUE_SIZE),
+                    timeout=getattr(settings, 'USERS_HASHING_TIMEOUT', DEFAULT_TIMEOUT),
+                )
+    return _service
+
+
+@receiver(setting_changed)
+def reset_service(**kwargs):
+    global _service
+    # workers have to be forked again to see new hashers
+    if kwargs['setting'].startswith('USERS_HASHING_') or kwargs['setting'] == 'PASSWORD_HASHERS':
+        with _service_lock:
+            service, _service = _service, None
+        if service is not None:
+            service.shutdown(wait=False)
+
+
+def make_password(password):
+    return get_service().make_password(password)
+
+
+def check_password(password, encoded, setter=None):
+    return get_service().check_password(password, encoded, setter)
+
+
+@contextmanager
+def batch_executor(workers=None):
+    """
+    Process pool for ``make_passwords``, with ``workers`` processes
+    (``USERS_HASHING_BATCH_WORKERS`` when not given). Yields ``None``
+    for 0 workers, which hashes inline.
+    """
+    if workers is None:
+        workers = getattr(settings, 'USERS_HASHING_BATCH_WORKERS', None)
+    if workers == 0:
+        yield None
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield executor
+
+
+def make_passwords(passwords, executor=None):
+    """
+    Return hashes of ``passwords``, in the same order. Hashed by
+    ``executor`` from ``batch_executor`` or inline without it.
+    """
+    if executor is None:
+        return [hashers.make_password(password) for password in passwords]
+    return list(executor.map(_make_password, passwords, chunksize=BATCH_CHUNKSIZE))
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = 'Compute email_skeleton for existing users, e.g. after adding the column or upgrading confusables data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of users per UPDATE.')
+
+    def handle(self, *args, **options):
+        UserModel = get_user_model()
+        manager = UserModel._default_manager
+        batch_size = options['batch_size']
+        last_pk = None
+        checked = updated = 0
+        while True:
+            users = manager.order_by('pk')
+            if last_pk is not None:
+                users = users.filter(pk__gt=last_pk)
+            batch = list(users.values_list('pk', 'email', 'email_skeleton')[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            changed = {}
+            for pk, email, current in batch:
+                skeleton = UserModel.get_email_skeleton(email)
+                if skeleton != current:
+                    changed[pk] = skeleton
+            with transaction.atomic(using=manager.db):
+                updated += manager.update_by_pk('email_skeleton', changed)
+            checked += len(batch)
+            self.stdout.write('Checked %d users, updated %d.' % (checked, updated))
+        self.stdout.write(self.style.SUCCESS('Done: checked %d users, updated %d.' % (checked, updated)))
@@ -0,0 +1,53 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Measure validators on generated ASCII, IDN, mixed-script and reserved-name corpora, '
+            'optionally comparing results with a stored baseline. No baseline is shipped, as latencies '
+            'depend on the machine: record one with --save-baseline before comparing with --baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000, help='Number of generated values per corpus.')
+        parser.add_argument('--rounds', type=int, default=3, help='Times each value is validated.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of generated corpora.')
+        parser.add_argument('--only', help='Run only benchmarks whose name contains this string.')
+        parser.add_argument('--baseline', help='JSON file with results to compare against, '
+                                               'written by an earlier run with --save-baseline.')
+        parser.add_argument('--save-baseline', help='Write results as JSON to this file.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed p50 latency growth over baseline, as a fraction.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            # before spending time on benchmarks
+            if not os.path.exists(options['baseline']):
+                raise CommandError('Baseline %s does not exist, record one first with --save-baseline %s.' % (
+                    options['baseline'], options['baseline']))
+            try:
+                baseline = benchmarks.load_baseline(options['baseline'])
+            except (OSError, ValueError) as e:
+                raise CommandError('Cannot read baseline: %s' % e)
+
+        results = benchmarks.run(options['count'], options['rounds'], options['seed'], options['only'])
+        self.stdout.write('%-34s %9s %9s %9s %12s' % ('benchmark', 'p50 us', 'p90 us', 'p99 us', 'calls/s'))
+        for name, result in results.items():
+            self.stdout.write('%-34s %9.2f %9.2f %9.2f %12.0f' % (
+                name, result['p50'], result['p90'], result['p99'], result['ops']))
+
+        if options['save_baseline']:
+            benchmarks.save_baseline(options['save_baseline'], results)
+            self.stdout.write('Saved baseline to %s' % options['save_baseline'])
+
+        if baseline is not None:
+            regressions = benchmarks.compare(results, baseline, options['tolerance'])
+            for name, before, after in regressions:
+                self.stderr.write('%s: p50 %.2fus -> %.2fus (%+.0f%%)' % (
+                    name, before, after, (after / before - 1) * 100))
+            if regressions:
+                raise CommandError('%d benchmark(s) regressed over baseline.' % len(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions over baseline.'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from ... import confusables
+
+
+class Command(BaseCommand):
+    help = 'Compile confusable_homoglyphs data into memory-mapped table used by validators.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='Path of the table, defaults to USERS_CONFUSABLES_TABLE setting.',
+        )
+
+    def handle(self, *args, **options):
+        path = confusables.build_table(options['output'] or confusables.get_table_path())
+        table = confusables.ConfusablesTable(path)
+        self.stdout.write(
+            'Wrote %s: %d ranges, %d confusable characters (confusable_homoglyphs %s).' % (
+                path, len(table.starts), len(table.confusable), table.source_version,
+            )
+        )
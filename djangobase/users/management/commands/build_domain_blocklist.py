@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ... import blocklist
+
+
+class Command(BaseCommand):
+    help = 'Compile disposable email domains list into memory-mapped table used by validators.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source',
+            default=None,
+            help='Text list of domains, defaults to USERS_DISPOSABLE_DOMAINS_SOURCE setting.',
+        )
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='Path of the table, defaults to USERS_DISPOSABLE_DOMAINS_TABLE setting.',
+        )
+
+    def handle(self, *args, **options):
+        source = options['source'] or getattr(
+            settings, 'USERS_DISPOSABLE_DOMAINS_SOURCE', blocklist.DEFAULT_DISPOSABLE_DOMAINS_SOURCE)
+        output = options['output'] or getattr(
+            settings, 'USERS_DISPOSABLE_DOMAINS_TABLE', blocklist.DEFAULT_DISPOSABLE_DOMAINS_TABLE)
+        path = blocklist.build_blocklist(source, output)
+        table = blocklist.DomainBlocklist.from_file(path)
+        self.stdout.write('Wrote %s: %d domains (source %s).' % (path, len(table), table.version))
@@ -0,0 +1,130 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from ...auth import EmailBackend
+from ...benchmarks import percentile
+from ...hashers import CalibratedPBKDF2PasswordHasher
+
+CALIBRATED_HASHER = 'users.hashers.CalibratedPBKDF2PasswordHasher'
+PASSWORD = 'calibration password'
+SALT = 'calibrationsalt'
+
+
+def measure(hasher, samples, **kwargs):
+    """
+    Median time in seconds of hashing a password with ``hasher``.
+    """
+    times = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        hasher.encode(PASSWORD, SALT, **kwargs)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def calibrate(target, samples, start=10000):
+    """
+    Return PBKDF2 iterations which take about ``target`` seconds.
+    Hashing time is linear in iterations, so we scale a short
+    measurement, then correct it at the estimated count.
+    """
+    hasher = CalibratedPBKDF2PasswordHasher()
+    iterations = start
+    for _ in range(2):
+        elapsed = measure(hasher, samples, iterations=iterations)
+        iterations = max(1000, int(iterations * target / elapsed))
+    return int(round(iterations, -3))
+
+
+def calibrated_hashers():
+    return [CALIBRATED_HASHER] + [path for path in settings.PASSWORD_HASHERS if path != CALIBRATED_HASHER]
+
+
+class Command(BaseCommand):
+    help = ('Pick PBKDF2 iterations hitting a target hashing time on this machine '
+            'and print settings using users.hashers.CalibratedPBKDF2PasswordHasher.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=100, help='Target time of hashing a password.')
+        parser.add_argument('--samples', type=int, default=5, help='Hashes timed per measurement.')
+        parser.add_argument('--iterations', type=int, help='Skip calibration and use these iterations.')
+        parser.add_argument('--output', help='Write settings snippet to this file.')
+        parser.add_argument('--verify-auth', action='store_true',
+                            help='Check EmailBackend.authenticate p99 latency with calibrated settings.')
+        parser.add_argument('--auth-samples', type=int, default=50, help='Logins timed by --verify-auth.')
+        parser.add_argument('--budget-ms', type=float,
+                            help='Allowed login p99 for --verify-auth, 1.5x --target-ms by default.')
+
+    def handle(self, *args, **options):
+        target = options['target_ms'] / 1000
+        preferred = get_hasher()
+        current = measure(preferred, options['samples'])
+        self.stdout.write('Current preferred hasher %s takes %.1fms.' % (preferred.algorithm, current * 1000))
+
+        iterations = options['iterations'] or calibrate(target, options['samples'])
+        elapsed = measure(CalibratedPBKDF2PasswordHasher(), options['samples'], iterations=iterations)
+        self.stdout.write('PBKDF2 with %d iterations takes %.1fms.' % (iterations, elapsed * 1000))
+        if iterations < PBKDF2PasswordHasher.iterations:
+            self.stderr.write(self.style.WARNING(
+                'This is fewer iterations than Django recommends, consider a higher --target-ms.'
+            ))
+
+        snippet = self.render_snippet(iterations, elapsed)
+        self.stdout.write(snippet)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(snippet)
+
+        if options['verify_auth']:
+            budget = options['budget_ms']
+            if budget is None:
+                budget = options['target_ms'] * 1.5
+            budget /= 1000
+            with override_settings(PASSWORD_HASHERS=calibrated_hashers(), USERS_PBKDF2_ITERATIONS=iterations):
+                p99 = self.measure_auth(options['auth_samples'])
+            self.stdout.write('EmailBackend.authenticate p99 is %.1fms, budget %.1fms.' % (p99 * 1000, budget * 1000))
+            if p99 > budget:
+                raise CommandError('Login p99 exceeds budget.')
+            self.stdout.write(self.style.SUCCESS('Login latency is within budget.'))
+
+    def render_snippet(self, iterations, elapsed):
+        lines = [
+            '# Generated by manage.py calibrate_hashers, hashing takes ~%.0fms on this machine.' % (elapsed * 1000),
+            'PASSWORD_HASHERS = [',
+        ]
+        lines += ["    '%s'," % path for path in calibrated_hashers()]
+        lines += [
+            ']',
+            'USERS_PBKDF2_ITERATIONS = %d' % iterations,
+            '',
+        ]
+        return '\n'.join(lines)
+
+    def measure_auth(self, samples):
+        """
+        Return p99 latency of logging in a temporary user,
+        who is rolled back afterwards.
+        """
+        UserModel = get_user_model()
+        backend = EmailBackend()
+        times = []
+        with transaction.atomic(using=UserModel._default_manager.db):
+            user = UserModel._default_manager.create_user(
+                email='calibrate-hashers@example.com', password=PASSWORD, is_active=True,
+            )
+            for _ in range(samples):
+                start = time.perf_counter()
+                authenticated = backend.authenticate(None, username=user.email, password=PASSWORD)
+                times.append(time.perf_counter() - start)
+                if authenticated != user:
+                    raise CommandError('Calibration user could not log in.')
+            transaction.set_rollback(True)
+        times.sort()
+        return percentile(times, 0.99)
@@ -0,0 +1,82 @@
+import csv
+import gzip
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+# never exported unless asked for
+EXCLUDED_FIELDS = ('password',)
+
+
+def open_target(path, compress):
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def get_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'csv' if name.endswith('.csv') else 'jsonl'
+
+
+def write_rows(f, format, fields, rows):
+    """
+    Write ``rows`` dicts to ``f`` one by one, returns number of rows.
+    """
+    count = 0
+    if format == 'csv':
+        writer = csv.DictWriter(f, fields)
+        writer.writeheader()
+        for count, row in enumerate(rows, 1):
+            writer.writerow(row)
+        return count
+    encoder = DjangoJSONEncoder()
+    for count, row in enumerate(rows, 1):
+        f.write(encoder.encode(row) + '\n')
+    return count
+
+
+class Command(BaseCommand):
+    help = 'Export users to a CSV or JSONL file, optionally gzipped, in constant memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to write, format is detected from .csv or .jsonl extension '
+                                         'and gzip from .gz extension.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Format of the file.')
+        parser.add_argument('--gzip', action='store_true', help='Compress the file with gzip.')
+        parser.add_argument('--fields', help='Comma separated fields to export, '
+                                             'defaults to all fields except %s.' % ', '.join(EXCLUDED_FIELDS))
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of users per query.')
+
+    def handle(self, *args, **options):
+        UserModel = get_user_model()
+        manager = UserModel._default_manager
+        names = [field.name for field in UserModel._meta.concrete_fields]
+        if options['fields']:
+            fields = [name.strip() for name in options['fields'].split(',')]
+            unknown = [name for name in fields if name not in names]
+            if unknown:
+                raise CommandError('Unknown fields: %s.' % ', '.join(unknown))
+        else:
+            fields = [name for name in names if name not in EXCLUDED_FIELDS]
+
+        path = options['path']
+        # readers never see a partial export
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        started = time.monotonic()
+        try:
+            with open_target(tmp_path, options['gzip'] or path.endswith('.gz')) as f:
+                count = write_rows(
+                    f, options['format'] or get_format(path), fields,
+                    manager.iter_by_pk(fields, options['batch_size']),
+                )
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS('Done: exported %d users to %s, %.0f rows/s.' % (
+            count, path, count / elapsed if elapsed else 0)))
@@ -0,0 +1,233 @@
+import csv
+import gzip
+import json
+import os
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import identify_hasher
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+
+from ... import hashing, validators
+from ...managers import UserManager
+
+# set by the database or derived from email
+SKIPPED_FIELDS = ('id', 'email_skeleton', 'date_joined')
+
+
+def open_source(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def get_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'csv' if name.endswith('.csv') else 'jsonl'
+
+
+def read_rows(f, format):
+    """
+    Yield ``(row number, dict)`` for rows of ``f``, dict is ``None``
+    for rows which can't be parsed.
+    """
+    if format == 'csv':
+        for number, row in enumerate(csv.DictReader(f), 1):
+            # empty cells are missing values
+            yield number, {key: value for key, value in row.items() if value != ''}
+        return
+    number = 0
+    for line in f:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+def read_checkpoint(path, source):
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return {'source': source, 'row': 0, 'created': 0, 'rejected': {}}
+    if checkpoint['source'] != source:
+        raise CommandError('Checkpoint %s belongs to %s, remove it to import %s.' % (
+            path, checkpoint['source'], source))
+    return checkpoint
+
+
+def write_checkpoint(path, checkpoint):
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+class Command(BaseCommand):
+    help = ('Import users from a CSV or JSONL file (optionally gzipped) with an email, '
+            'password and other user fields per row.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, format is detected from .csv or .jsonl extension.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Format of the file.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of users per INSERT.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Hashing processes, 0 hashes in this process.')
+        parser.add_argument('--hashed', action='store_true',
+                            help='Passwords are already hashed by one of PASSWORD_HASHERS.')
+        parser.add_argument('--checkpoint', help='File recording progress, the command resumes from it. '
+                                                 'Defaults to the imported path with .checkpoint suffix.')
+        parser.add_argument('--rejects', help='JSONL file rejected rows are appended to.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        source = os.path.abspath(path)
+        checkpoint_path = options['checkpoint'] or path + '.checkpoint'
+        checkpoint = read_checkpoint(checkpoint_path, source)
+        if checkpoint['row']:
+            self.stdout.write('Resuming after row %d.' % checkpoint['row'])
+
+        UserModel = get_user_model()
+        self.manager = UserModel._default_manager
+        self.fields = {
+            field.name: field for field in UserModel._meta.concrete_fields if field.name not in SKIPPED_FIELDS
+        }
+        self.hashed = options['hashed']
+        rejects = open(options['rejects'], 'a') if options['rejects'] else None
+        try:
+            # one pool for all batches, processes are slow to start
+            workers = 0 if self.hashed else options['workers']
+            with open_source(path) as f, hashing.batch_executor(workers) as executor:
+                rows = read_rows(f, options['format'] or get_format(path))
+                self.import_rows(rows, checkpoint, checkpoint_path, rejects, options['batch_size'], executor)
+        finally:
+            if rejects is not None:
+                rejects.close()
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.stdout.write(self.style.SUCCESS('Done: %s.' % self.describe(checkpoint)))
+
+    def import_rows(self, rows, checkpoint, checkpoint_path, rejects, batch_size, executor):
+        started = time.monotonic()
+        imported = 0
+        batch = []
+        for number, row in rows:
+            if number <= checkpoint['row']:
+                continue
+            batch.append((number, row))
+            if len(batch) >= batch_size:
+                self.import_batch(batch, checkpoint, rejects, executor)
+                imported += len(batch)
+                batch = []
+                write_checkpoint(checkpoint_path, checkpoint)
+                self.report(checkpoint, imported, started)
+        if batch:
+            self.import_batch(batch, checkpoint, rejects, executor)
+            imported += len(batch)
+            write_checkpoint(checkpoint_path, checkpoint)
+            self.report(checkpoint, imported, started)
+
+    def import_batch(self, batch, checkpoint, rejects, executor):
+        rejected = Counter()
+        valid = {}
+        # verdicts of disposable domains, most rows share a few domains
+        domains = {}
+        for number, row in batch:
+            try:
+                valid[number] = self.clean_row(row, domains)
+            except ValidationError as e:
+                rejected[e.code] += 1
+                self.reject(rejects, number, row, e.code)
+        # confusables verdicts are shared by the batch
+        emails = [data['email'] for data in valid.values()]
+        for (number, data), (email, codes) in zip(list(valid.items()), validators.validate_many(emails)):
+            if codes:
+                del valid[number]
+                rejected[codes[0]] += 1
+                self.reject(rejects, number, data, codes[0])
+        result = self.manager.bulk_create_users(
+            valid.values(), chunk_size=len(batch), hashed=self.hashed, executor=executor,
+        )
+        if result.duplicates:
+            # case variants are duplicates too, all but the first row of
+            # an email are, or all of them if the email is already taken
+            rows = {}
+            for number, data in valid.items():
+                rows.setdefault(data['email'].lower(), []).append(number)
+            for email in result.duplicates:
+                self.reject(rejects, rows[email.lower()].pop(), {'email': email}, 'duplicate')
+            rejected['duplicate'] += len(result.duplicates)
+        if rejects is not None:
+            rejects.flush()
+        checkpoint['row'] = batch[-1][0]
+        checkpoint['created'] += result.created
+        for code, count in rejected.items():
+            checkpoint['rejected'][code] = checkpoint['rejected'].get(code, 0) + count
+
+    def clean_row(self, row, domains):
+        """
+        Return fields of user in ``row``, converted to Python values,
+        or raise ``ValidationError`` with code of the first problem.
+        """
+        if row is None:
+            raise ValidationError('Malformed row.', code='malformed')
+        unknown = set(row) - set(self.fields)
+        if unknown:
+            raise ValidationError('Unknown fields: %s.' % ', '.join(sorted(unknown)), code='unknown_field')
+        email = row.get('email')
+        if not email or not isinstance(email, str):
+            raise ValidationError('Email must be set.', code='required')
+        email = UserManager.normalize_email(email)
+        validate_email(email)
+        domain = email.rpartition('@')[2]
+        if domain not in domains:
+            try:
+                validators.validate_disposable_email(email)
+                domains[domain] = None
+            except ValidationError as e:
+                domains[domain] = e
+        if domains[domain] is not None:
+            raise domains[domain]
+        data = {'email': email}
+        for name, value in row.items():
+            if name == 'email':
+                continue
+            if name == 'password':
+                if self.hashed:
+                    try:
+                        if not isinstance(value, str):
+                            raise ValueError
+                        identify_hasher(value)
+                    except ValueError:
+                        raise ValidationError('Unknown password hash.', code='invalid_hash')
+                data[name] = value
+                continue
+            data[name] = self.fields[name].to_python(value)
+        return data
+
+    def reject(self, rejects, number, row, code):
+        if rejects is None:
+            return
+        if row is not None:
+            # never write passwords out
+            row = {key: value for key, value in row.items() if key != 'password'}
+        rejects.write(json.dumps({'row': number, 'code': code, 'data': row}, default=str) + '\n')
+
+    def describe(self, checkpoint):
+        rejected = checkpoint['rejected']
+        details = ', '.join('%s %d' % (code, count) for code, count in sorted(rejected.items()))
+        return '%d rows, created %d users, rejected %d%s' % (
+            checkpoint['row'], checkpoint['created'], sum(rejected.values()),
+            ' (%s)' % details if details else '',
+        )
+
+    def report(self, checkpoint, imported, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write('%s, %.0f rows/s.' % (self.describe(checkpoint), imported / elapsed if elapsed else 0))
@@ -0,0 +1,98 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from operator import or_
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hashers_by_algorithm
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from ...hashers import WRAPPED_HASHERS, wrap_hash
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'last_pk': None, 'upgraded': 0}
+
+
+def write_checkpoint(path, checkpoint):
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+class Command(BaseCommand):
+    help = ('Wrap weak SHA1 and MD5 password hashes with PBKDF2, '
+            'see users.hashers.PBKDF2WrappedSHA1PasswordHasher.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of users per UPDATE.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Hashing processes, 0 hashes in this process.')
+        parser.add_argument('--rate', type=float, default=0, help='Maximum upgraded users per second, 0 for no limit.')
+        parser.add_argument('--checkpoint', default='upgrade_password_hashes.checkpoint',
+                            help='File recording progress, the command resumes from it.')
+
+    def handle(self, *args, **options):
+        # users couldn't log in with hashes no configured hasher verifies
+        configured = get_hashers_by_algorithm()
+        missing = [hasher.__module__ + '.' + hasher.__name__
+                   for hasher in WRAPPED_HASHERS.values() if hasher.algorithm not in configured]
+        if missing:
+            raise CommandError('Add %s to PASSWORD_HASHERS first.' % ', '.join(missing))
+
+        path = options['checkpoint']
+        checkpoint = read_checkpoint(path)
+        if checkpoint['last_pk'] is not None:
+            self.stdout.write('Resuming after pk %s.' % checkpoint['last_pk'])
+
+        workers = options['workers']
+        pool = ProcessPoolExecutor(workers) if workers > 0 else None
+        try:
+            self.upgrade(checkpoint, path, pool, workers, options['batch_size'], options['rate'])
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        if os.path.exists(path):
+            os.remove(path)
+        self.stdout.write(self.style.SUCCESS('Done: upgraded %d users.' % checkpoint['upgraded']))
+
+    def upgrade(self, checkpoint, path, pool, workers, batch_size, rate):
+        UserModel = get_user_model()
+        manager = UserModel._default_manager
+        weak = reduce(or_, [Q(password__startswith=algorithm + '$') for algorithm in WRAPPED_HASHERS])
+        started = time.monotonic()
+        upgraded = 0
+        while True:
+            users = manager.filter(weak).order_by('pk')
+            if checkpoint['last_pk'] is not None:
+                users = users.filter(pk__gt=checkpoint['last_pk'])
+            batch = list(users.values_list('pk', 'password')[:batch_size])
+            if not batch:
+                break
+            old_hashes = [password for pk, password in batch]
+            if pool is not None:
+                chunksize = max(1, len(batch) // (workers * 4))
+                new_hashes = pool.map(wrap_hash, old_hashes, chunksize=chunksize)
+            else:
+                new_hashes = map(wrap_hash, old_hashes)
+            hashes = {pk: (old, new) for (pk, old), new in zip(batch, new_hashes)}
+            with transaction.atomic(using=manager.db):
+                updated = manager.update_passwords(hashes)
+            upgraded += updated
+            checkpoint['last_pk'] = batch[-1][0]
+            checkpoint['upgraded'] += updated
+            write_checkpoint(path, checkpoint)
+            self.stdout.write('Upgraded %d users, last pk %s.' % (checkpoint['upgraded'], checkpoint['last_pk']))
+            if rate:
+                delay = upgraded / rate - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
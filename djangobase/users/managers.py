@@ -1,7 +1,91 @@
+from functools import reduce
+from itertools import islice
+from operator import or_
+
 from django.contrib.auth.base_user import BaseUserManager
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import signals
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from . import hashing
+
+
+def supports_insert_returning(connection):
+    """
+    Whether ``connection`` supports ``INSERT ... ON CONFLICT
+    (...) DO NOTHING RETURNING``.
+    """
+    if connection.vendor == 'postgresql':
+        return connection.pg_version >= 90500
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35, 0)
+    return False
+
+
+class BulkCreateResult(object):
+    """
+    Outcome of ``UserManager.bulk_create_users``: number of created
+    users and emails which were skipped as already taken.
+    """
+    def __init__(self):
+        self.created = 0
+        self.duplicates = []
+
+    def __repr__(self):
+        return '<BulkCreateResult created=%d duplicates=%d>' % (self.created, len(self.duplicates))
+
+
+class UserQuerySet(models.QuerySet):
+    """
+    Lookups of users by email and activation state. Filtering on
+    ``is_active`` alone is served by partial indexes, see
+    migration 0004.
+    """
 
+    # columns needed to authenticate and activate users,
+    # others are loaded when accessed
+    authentication_fields = ('email', 'password', 'is_active', 'last_login')
 
-class UserManager(BaseUserManager):
+    def active(self):
+        return self.filter(is_active=True)
+
+    def pending_activation(self):
+        """ Users who registered but didn't activate their account yet. """
+        return self.filter(is_active=False)
+
+    def stale_pending(self, older_than):
+        """
+        Users pending activation who joined more than
+        ``older_than`` (a timedelta) ago.
+        """
+        return self.pending_activation().filter(date_joined__lt=timezone.now() - older_than)
+
+    def filter_by_email(self, email):
+        """
+        Users with ``email`` compared case-insensitively. Both sides are
+        lowercased by the database, so the lookup uses the unique index
+        on ``LOWER(email)``, see migration 0003.
+        """
+        return self.annotate(email_lower=Lower('email')).filter(
+            email_lower=Lower(models.Value(email, output_field=models.EmailField()))
+        )
+
+    def get_by_email(self, email, **kwargs):
+        return self.filter_by_email(email).get(**kwargs)
+
+    def get_for_authentication(self, email, **kwargs):
+        """
+        Like ``get_by_email``, but only loads ``authentication_fields``
+        (and primary key) instead of the full, possibly wide, row.
+        """
+        names = {field.name for field in self.model._meta.concrete_fields}
+        fields = [name for name in self.authentication_fields if name in names]
+        return self.filter_by_email(email).only(*fields).get(**kwargs)
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
     """ Base Manager for our Models. Creates users
     with e-mail address, password and all your extra fields. """
     use_in_migrations = True
@@ -16,20 +100,250 @@ class UserManager(BaseUserManager):
         user.save(using=self._db)
         return user
 
+    def _set_defaults(self, extra_fields, **defaults):
+        """ Set defaults for fields which our Model has. """
+        for name, value in defaults.items():
+            if hasattr(self.model, name):
+                extra_fields.setdefault(name, value)
+        return extra_fields
+
     def create_user(self, email, password=None, **extra_fields):
-        if hasattr(self.model, 'is_staff'):
-            extra_fields.setdefault('is_staff', False)
-        if hasattr(self.model, 'is_superuser'):
-            extra_fields.setdefault('is_superuser', False)
-        if hasattr(self.model, 'is_active'):
-            extra_fields.setdefault('is_active', False)
+        self._set_defaults(extra_fields, is_staff=False, is_superuser=False, is_active=False)
         return self._create_user(email, password, **extra_fields)
 
     def create_superuser(self, email, password, **extra_fields):
-        if hasattr(self.model, 'is_staff'):
-            extra_fields.setdefault('is_staff', True)
-        if hasattr(self.model, 'is_superuser'):
-            extra_fields.setdefault('is_superuser', True)
-        if hasattr(self.model, 'is_active'):
-            extra_fields.setdefault('is_active', True)
+        self._set_defaults(extra_fields, is_staff=True, is_superuser=True, is_active=True)
         return self._create_user(email, password, **extra_fields)
+
+    def bulk_create_users(self, users, chunk_size=1000, workers=None, hashed=False, executor=None):
+        """
+        Create users from an iterable of dicts with ``email``,
+        ``password`` and extra fields, with the same defaults as
+        ``create_user``. Passwords are hashed by ``workers`` processes,
+        see ``hashing.make_passwords``, or stored as they are if
+        already ``hashed``. Users are inserted with one ``bulk_create``
+        per ``chunk_size`` users. The iterable is consumed lazily, one
+        chunk at a time.
+
+        Callers creating users in many calls can pass an ``executor``
+        from ``hashing.batch_executor`` to reuse its processes instead
+        of starting ``workers`` new ones per call.
+
+        Emails already taken, or repeated in ``users``, compared
+        case-insensitively, are skipped and reported in the returned
+        ``BulkCreateResult``. Like ``bulk_create``, no signals are sent.
+        """
+        if executor is not None:
+            return self._bulk_create_users(users, chunk_size, executor, hashed)
+        with hashing.batch_executor(0 if hashed else workers) as executor:
+            return self._bulk_create_users(users, chunk_size, executor, hashed)
+
+    def _bulk_create_users(self, users, chunk_size, executor, hashed):
+        result = BulkCreateResult()
+        seen = set()
+        users = iter(users)
+        while True:
+            chunk = list(islice(users, chunk_size))
+            if not chunk:
+                break
+            self._bulk_create_chunk(chunk, seen, executor, hashed, result)
+        return result
+
+    def _bulk_create_chunk(self, chunk, seen, executor, hashed, result):
+        fields = []
+        for data in chunk:
+            extra_fields = dict(data)
+            email = extra_fields.pop('email', None)
+            if not email:
+                raise ValueError('Email must be set.')
+            email = self.normalize_email(email)
+            if email.lower() in seen:
+                result.duplicates.append(email)
+                continue
+            seen.add(email.lower())
+            extra_fields['email'] = email
+            fields.append(self._set_defaults(extra_fields, is_staff=False, is_superuser=False, is_active=False))
+        taken = set(self.annotate(email_lower=Lower('email')).filter(
+            email_lower__in=[f['email'].lower() for f in fields]
+        ).values_list('email_lower', flat=True))
+        result.duplicates.extend(f['email'] for f in fields if f['email'].lower() in taken)
+        fields = [f for f in fields if f['email'].lower() not in taken]
+        passwords = [f.pop('password', None) for f in fields]
+        if hashed:
+            hashes = [make_password(None) if p is None else p for p in passwords]
+        else:
+            # don't hash passwords of skipped users
+            hashes = hashing.make_passwords(passwords, executor)
+        objs = [self._build_user(encoded, **extra_fields) for extra_fields, encoded in zip(fields, hashes)]
+        try:
+            with transaction.atomic(using=self.db):
+                self.bulk_create(objs)
+            result.created += len(objs)
+        except IntegrityError:
+            # taken meanwhile, or only equal when lowercased by the
+            # database; insert one by one to find out which
+            for user in objs:
+                try:
+                    with transaction.atomic(using=self.db):
+                        self.bulk_create([user])
+                    result.created += 1
+                except IntegrityError:
+                    if not self.filter_by_email(user.email).exists():
+                        raise
+                    result.duplicates.append(user.email)
+
+    def _build_user(self, encoded_password, **fields):
+        user = self.model(password=encoded_password, **fields)
+        if hasattr(user, 'get_email_skeleton'):
+            # set by ``save``, which bulk inserts skip
+            user.email_skeleton = user.get_email_skeleton(user.email)
+        return user
+
+    def get_or_create_user(self, email, password=None, **extra_fields):
+        """
+        Return ``(user, created)``, the user with ``email`` compared
+        case-insensitively, or a new one created like ``create_user``.
+
+        The new user is inserted first, with ``INSERT ... ON CONFLICT
+        (LOWER(email)) DO NOTHING RETURNING`` on PostgreSQL and SQLite
+        3.35+, so creating a user takes one query; only when the email
+        is taken the user is fetched by another query. Concurrent
+        inserts of the same email can still violate the unique
+        constraint on ``email`` itself, that ``IntegrityError`` is
+        handled like a taken email, which on PostgreSQL inside a
+        transaction takes a savepoint. Elsewhere the INSERT always runs
+        in a savepoint. The password is hashed once either way.
+        """
+        if not email:
+            raise ValueError('Email must be set.')
+        email = self.normalize_email(email)
+        self._set_defaults(extra_fields, is_staff=False, is_superuser=False, is_active=False)
+        encoded = hashing.make_password(password)
+        for retry in (False, True):
+            user = self._build_user(encoded, email=email, **extra_fields)
+            if self._insert_if_absent(user):
+                return user, True
+            try:
+                return self.get_by_email(email), False
+            except self.model.DoesNotExist:
+                # deleted since the conflict (try again), or not
+                # visible to this transaction's snapshot
+                if retry:
+                    raise
+
+    def _insert_if_absent(self, user):
+        """
+        Insert ``user`` unless its email is taken, returns
+        whether it was inserted. Sends ``pre_save`` and
+        ``post_save`` like ``save`` does.
+        """
+        connection = connections[self.db]
+        if not supports_insert_returning(connection):
+            try:
+                with transaction.atomic(using=self.db):
+                    user.save(force_insert=True, using=self.db)
+            except IntegrityError:
+                if not self.filter_by_email(user.email).exists():
+                    raise
+                return False
+            return True
+        opts = self.model._meta
+        signals.pre_save.send(sender=self.model, instance=user, raw=False, using=self.db, update_fields=None)
+        fields = [field for field in opts.concrete_fields if not isinstance(field, models.AutoField)]
+        qn = connection.ops.quote_name
+        # only conflicts on the LOWER(email) index (see migration 0003)
+        # are expected, others still raise IntegrityError
+        sql = 'INSERT INTO %s (%s) VALUES (%s) ON CONFLICT (LOWER(%s)) DO NOTHING RETURNING %s' % (
+            qn(opts.db_table),
+            ', '.join(qn(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+            qn(opts.get_field('email').column),
+            qn(opts.pk.column),
+        )
+        params = [field.get_db_prep_save(field.pre_save(user, True), connection) for field in fields]
+        # a failed statement aborts the whole transaction on PostgreSQL
+        sid = None
+        if connection.vendor == 'postgresql' and connection.in_atomic_block:
+            sid = transaction.savepoint(using=self.db)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+        except IntegrityError:
+            # same email inserted concurrently, on the other unique index
+            if sid is not None:
+                transaction.savepoint_rollback(sid, using=self.db)
+            if not self.filter_by_email(user.email).exists():
+                raise
+            return False
+        if sid is not None:
+            transaction.savepoint_commit(sid, using=self.db)
+        if row is None:
+            return False
+        user.pk = row[0]
+        user._state.adding = False
+        user._state.db = self.db
+        signals.post_save.send(
+            sender=self.model, instance=user, created=True, update_fields=None, raw=False, using=self.db,
+        )
+        return True
+
+    def get_by_natural_key(self, email):
+        return self.get_by_email(email)
+
+    def iter_by_pk(self, fields, batch_size=1000):
+        """
+        Yield dicts of ``fields`` of all users in primary key order.
+        Each page of ``batch_size`` users is a separate short query
+        for primary keys after the last one seen (keyset pagination),
+        read with ``iterator()``, so memory stays flat regardless of
+        table size and no transaction or lock is held between pages.
+        """
+        fields = list(fields)
+        last_pk = None
+        while True:
+            users = self.order_by('pk')
+            if last_pk is not None:
+                users = users.filter(pk__gt=last_pk)
+            count = 0
+            for row in users.values_list('pk', *fields)[:batch_size].iterator():
+                last_pk = row[0]
+                count += 1
+                yield dict(zip(fields, row[1:]))
+            if count < batch_size:
+                break
+
+    def update_by_pk(self, field_name, values):
+        """
+        Set ``field_name`` for many rows in a single UPDATE,
+        ``values`` maps primary keys to new values.
+        Returns number of updated rows.
+        Like ``update()`` it sends no signals, so cached users
+        aren't invalidated, see ``auth.CachedEmailBackend``.
+        """
+        if not values:
+            return 0
+        field = self.model._meta.get_field(field_name)
+        return self.filter(pk__in=list(values)).update(**{
+            field_name: models.Case(
+                *[models.When(pk=pk, then=models.Value(value)) for pk, value in values.items()],
+                output_field=field
+            )
+        })
+
+    def update_passwords(self, hashes):
+        """
+        Replace password hashes in a single UPDATE, ``hashes`` maps
+        primary keys to ``(old_hash, new_hash)``. Rows whose password
+        no longer equals ``old_hash`` are left alone.
+        Returns number of updated rows.
+        """
+        if not hashes:
+            return 0
+        field = self.model._meta.get_field('password')
+        return self.filter(
+            reduce(or_, [models.Q(pk=pk, password=old) for pk, (old, new) in hashes.items()])
+        ).update(password=models.Case(
+            *[models.When(pk=pk, then=models.Value(new)) for pk, (old, new) in hashes.items()],
+            output_field=field
+        ))
@@ -0,0 +1,81 @@
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+INDEX_NAME = 'users_user_email_lower_uniq'
+
+
+def find_duplicates(User):
+    """
+    Return ``{lowercased email: [users]}`` for emails used by more
+    than one account when compared case-insensitively.
+    """
+    emails = User.objects.annotate(email_lower=Lower('email')).values('email_lower').annotate(
+        count=Count('pk'),
+    ).filter(count__gt=1).values_list('email_lower', flat=True)
+    duplicates = {}
+    users = User.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=list(emails))
+    for user in users.order_by('email_lower', 'pk'):
+        duplicates.setdefault(user.email_lower, []).append(user)
+    return duplicates
+
+
+def render_report(duplicates):
+    """
+    Describe duplicated accounts, suggesting to keep the active
+    one which logged in last (or the oldest, if none did).
+    """
+    lines = ['%d emails are used by more than one account:' % len(duplicates)]
+    for email, users in sorted(duplicates.items()):
+        keep = max(users, key=lambda u: (u.is_active, u.last_login is not None, u.last_login, -u.pk))
+        lines.append('  %s' % email)
+        for user in users:
+            lines.append('    %s pk=%s email=%s active=%s last_login=%s joined=%s' % (
+                'keep  ' if user is keep else 'remove',
+                user.pk, user.email, user.is_active, user.last_login, user.date_joined,
+            ))
+    lines.append('Merge or delete the accounts marked "remove", then run migrate again.')
+    return '\n'.join(lines)
+
+
+def check_duplicates(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    duplicates = find_duplicates(User)
+    if duplicates:
+        raise RuntimeError(render_report(duplicates))
+
+
+def create_index(apps, schema_editor):
+    table = schema_editor.quote_name(apps.get_model('users', 'User')._meta.db_table)
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        # doesn't lock the table while the index is built,
+        # which is why this migration isn't atomic
+        sql = 'CREATE UNIQUE INDEX CONCURRENTLY %s ON %s (LOWER(email))'
+    elif vendor == 'mysql':
+        sql = 'CREATE UNIQUE INDEX %s ON %s ((LOWER(email)))'
+    else:
+        sql = 'CREATE UNIQUE INDEX %s ON %s (LOWER(email))'
+    schema_editor.execute(sql % (schema_editor.quote_name(INDEX_NAME), table))
+
+
+def drop_index(apps, schema_editor):
+    table = apps.get_model('users', 'User')._meta.db_table
+    if schema_editor.connection.vendor == 'mysql':
+        sql = 'DROP INDEX %s ON %s' % (schema_editor.quote_name(INDEX_NAME), schema_editor.quote_name(table))
+    else:
+        sql = 'DROP INDEX %s' % schema_editor.quote_name(INDEX_NAME)
+    schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('users', '0002_user_email_skeleton'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.RunPython(create_index, drop_index),
+    ]
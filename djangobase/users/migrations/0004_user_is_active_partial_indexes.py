@@ -0,0 +1,58 @@
+from django.db import migrations
+
+# name: (column, is_active)
+INDEXES = {
+    # active users listed by email
+    'users_user_active_email': ('email', True),
+    # pending users by age, see UserQuerySet.stale_pending
+    'users_user_pending_date_joined': ('date_joined', False),
+}
+
+
+def get_predicate(schema_editor, is_active):
+    """
+    Index predicate matching ``filter(is_active=...)`` as the
+    database's planner sees it, ``None`` if partial indexes
+    aren't supported.
+    """
+    column = schema_editor.quote_name('is_active')
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        return column if is_active else 'NOT %s' % column
+    if vendor == 'sqlite':
+        # only used when the query compares to the same literal
+        return '%s = %d' % (column, is_active)
+    return None
+
+
+def create_indexes(apps, schema_editor):
+    table = schema_editor.quote_name(apps.get_model('users', 'User')._meta.db_table)
+    for name, (column, is_active) in sorted(INDEXES.items()):
+        predicate = get_predicate(schema_editor, is_active)
+        if predicate is None:
+            continue
+        # CONCURRENTLY doesn't lock the table, which is why
+        # this migration isn't atomic
+        sql = 'CREATE INDEX %s%s ON %s (%s) WHERE %s' % (
+            'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql' else '',
+            schema_editor.quote_name(name), table, schema_editor.quote_name(column), predicate,
+        )
+        schema_editor.execute(sql)
+
+
+def drop_indexes(apps, schema_editor):
+    for name, (column, is_active) in sorted(INDEXES.items()):
+        if get_predicate(schema_editor, is_active) is not None:
+            schema_editor.execute('DROP INDEX %s' % schema_editor.quote_name(name))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('users', '0003_user_email_lower_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -1,7 +1,9 @@
 from django.contrib.auth.base_user import AbstractBaseUser
 from django.core.mail import send_mail
 from django.db import models
+from django.utils.crypto import salted_hmac
 from django.utils.translation import gettext_lazy as _
+from . import confusables, hashing, rehash
 from .managers import UserManager
 
 
@@ -70,6 +72,9 @@ class AbstractEmailUser(AbstractBaseUser):
     """
 
     email = models.EmailField(unique=True, max_length=255)
+    # UTS #39 skeleton of normalized email, equal for emails
+    # which look the same, see ``confusables.skeleton``
+    email_skeleton = models.CharField(max_length=1024, db_index=True, editable=False, default='')
     date_joined = models.DateTimeField(auto_now_add=True)
 
     objects = UserManager()
@@ -83,6 +88,35 @@ class AbstractEmailUser(AbstractBaseUser):
         verbose_name = _('user')
         verbose_name_plural = _('users')
 
+    @staticmethod
+    def get_email_skeleton(email):
+        return confusables.skeleton(UserManager.normalize_email(email))
+
+    def set_password(self, raw_password):
+        # hashed by the worker pool when configured, see ``users.hashing``
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        def setter(raw_password):
+            self.set_password(raw_password)
+            # Password hash upgrades shouldn't be considered password changes.
+            self._password = None
+            self.save(update_fields=['password'])
+        return hashing.check_password(raw_password, self.password, setter)
+
+    def get_session_auth_hash(self):
+        # sessions survive password hash upgrades made in background
+        key_salt = 'django.contrib.auth.models.AbstractBaseUser.get_session_auth_hash'
+        return salted_hmac(key_salt, rehash.session_hash_password(self)).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.email_skeleton = self.get_email_skeleton(self.email)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'email' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'email_skeleton'}
+        super(AbstractEmailUser, self).save(*args, **kwargs)
+
 
 class User(AbstractSuperUser, AbstractEmailUser):
     pass
@@ -0,0 +1,232 @@
+"""
+Password hash upgrades deferred to a background thread.
+
+When the preferred hasher or its work factor changes, Django hashes
+the password again and saves it inside ``check_password``, so every
+user's next login pays for a second hash and an UPDATE. With
+``USERS_DEFERRED_REHASH = True`` ``EmailBackend`` queues the upgrade
+instead and returns as soon as the password is verified.
+A single thread hashes queued passwords and writes them in batches:
+
+    USERS_REHASH_QUEUE_SIZE = 1000  # upgrades waiting, more are dropped
+    USERS_REHASH_BATCH_SIZE = 100   # rows per UPDATE
+    USERS_REHASH_INTERVAL = 1       # seconds to wait for a batch to fill
+
+Each row is only updated if its hash didn't change meanwhile, so
+a password changed after login is never overwritten. Upgrades
+dropped on a full queue or lost on restart happen on a later login.
+
+Sessions are bound to an HMAC of the password hash, and the session
+of the login which queued an upgrade still holds the old one. So we
+remember in cache which hash each upgraded hash replaced, and
+``session_hash_password`` keeps returning the old hash until the
+password is changed for real. Logins meanwhile bind their sessions to
+the old hash too, so serving it extends the entry to
+``SESSION_COOKIE_AGE`` from then (written at most once a minute,
+``ALIAS_REFRESH_INTERVAL``). That cache has to be
+shared by all workers (``USERS_REHASH_CACHE``, 'default' if unset),
+otherwise users would be logged out after an upgrade, so deferring
+refuses to work with a per-process cache. If cache entries can be
+evicted before ``SESSION_COOKIE_AGE``, some sessions still end early.
+"""
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+from . import hashing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_INTERVAL = 1
+
+_STOP = object()
+
+# seconds an alias may have been served since it was last extended
+ALIAS_REFRESH_INTERVAL = 60
+
+
+class RehashQueue(object):
+
+    def __init__(self, maxsize=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE, interval=DEFAULT_INTERVAL):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.stats = {'queued': 0, 'dropped': 0, 'updated': 0, 'stale': 0}
+        self._queue = queue.Queue(maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, user, raw_password):
+        """
+        Queue upgrade of ``user``'s current hash to a fresh hash
+        of ``raw_password``. Returns ``False`` if the queue is full.
+        """
+        try:
+            self._queue.put_nowait((type(user), user.pk, user.password, raw_password))
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+        self.stats['queued'] += 1
+        self._start()
+        return True
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='users-rehash', daemon=True)
+                    self._thread.start()
+
+    def _get_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size and batch[-1] is not _STOP:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._get_batch()
+            stop = batch[-1] is _STOP
+            try:
+                self.process([item for item in batch if item is not _STOP])
+            except Exception:
+                logger.exception('Upgrading %d password hashes failed.', len(batch))
+            finally:
+                close_old_connections()
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def process(self, batch):
+        """
+        Hash passwords of ``batch`` items and save them,
+        one UPDATE per user model.
+        """
+        models = {}
+        for model, pk, old_hash, raw_password in batch:
+            models.setdefault(model, {})[pk] = (old_hash, hashing.make_password(raw_password))
+        for model, hashes in models.items():
+            # before the UPDATE, so sessions never see the new hash unaliased
+            _set_aliases({_cache_key(model, pk): hash_pair for pk, hash_pair in hashes.items()})
+            updated = model._default_manager.update_passwords(hashes)
+            self.stats['updated'] += updated
+            self.stats['stale'] += len(hashes) - updated
+
+    def flush(self):
+        """
+        Block until all queued upgrades are saved.
+        """
+        self._queue.join()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def is_deferred():
+    if not getattr(settings, 'USERS_DEFERRED_REHASH', False):
+        return False
+    if isinstance(get_cache(), (LocMemCache, DummyCache)):
+        raise ImproperlyConfigured(
+            'USERS_DEFERRED_REHASH requires USERS_REHASH_CACHE to be a cache shared by all workers.'
+        )
+    return True
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = RehashQueue(
+                    maxsize=getattr(settings, 'USERS_REHASH_QUEUE_SIZE', DEFAULT_QUEUE_SIZE),
+                    batch_size=getattr(settings, 'USERS_REHASH_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+                    interval=getattr(settings, 'USERS_REHASH_INTERVAL', DEFAULT_INTERVAL),
+                )
+    return _queue
+
+
+@receiver(setting_changed)
+def reset_queue(**kwargs):
+    global _queue
+    if kwargs['setting'].startswith('USERS_REHASH_'):
+        with _queue_lock:
+            rehash_queue, _queue = _queue, None
+        if rehash_queue is not None:
+            rehash_queue.stop()
+
+
+def get_cache():
+    return caches[getattr(settings, 'USERS_REHASH_CACHE', 'default')]
+
+
+def _cache_key(model, pk):
+    return 'users:rehash:%s:%s' % (model._meta.label_lower, pk)
+
+
+def _set_aliases(aliases):
+    """
+    Remember ``{cache key: (old hash, new hash)}`` for sessions
+    bound from now on, i.e. for ``SESSION_COOKIE_AGE``.
+    """
+    expires = time.time() + settings.SESSION_COOKIE_AGE
+    get_cache().set_many(
+        {key: (old_hash, new_hash, expires) for key, (old_hash, new_hash) in aliases.items()},
+        settings.SESSION_COOKIE_AGE,
+    )
+
+
+def session_hash_password(user):
+    """
+    Return password hash ``user``'s sessions are bound to: the
+    hash before a background upgrade, if one replaced it.
+    """
+    if not is_deferred():
+        return user.password
+    key = _cache_key(type(user), user.pk)
+    upgrade = get_cache().get(key)
+    if upgrade is not None:
+        old_hash, new_hash, expires = upgrade
+        if new_hash == user.password:
+            # a session may be bound to it now, e.g. by a login
+            if expires - time.time() < settings.SESSION_COOKIE_AGE - ALIAS_REFRESH_INTERVAL:
+                _set_aliases({key: (old_hash, new_hash)})
+            return old_hash
+    return user.password
+
+
+def check_password(user, raw_password):
+    """
+    Verify ``raw_password`` of ``user``, queueing upgrade
+    of its hash instead of saving it inline when deferred.
+    """
+    if not is_deferred():
+        return user.check_password(raw_password)
+    return hashing.check_password(
+        raw_password, user.password, lambda raw_password: get_queue().put(user, raw_password)
+    )
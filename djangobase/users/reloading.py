@@ -0,0 +1,113 @@
+"""
+Data files which are re-indexed in the background when they change on disk.
+
+``ReloadableData.get()`` always returns the current index without
+blocking. At most every ``USERS_DATAFILES_RELOAD_INTERVAL`` seconds
+it stats the watched files; if any of them changed, a background thread
+builds a new index and swaps it in with a single reference assignment,
+so readers see either the old or the new index, never a partial one.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RELOAD_INTERVAL = 5
+
+
+def _signature(paths):
+    result = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            result.append(None)
+        else:
+            result.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+    return tuple(result)
+
+
+class ReloadableData(object):
+    """
+    Lazily built index of data files at ``paths()``.
+
+    ``paths`` and ``loader`` are callables, so settings are read
+    on first use: ``loader()`` builds the index from current files.
+    """
+    def __init__(self, paths, loader):
+        self.paths = paths
+        self.loader = loader
+        self.reloads = 0
+        self._value = None
+        self._signature = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self._reloading = threading.Lock()
+
+    @staticmethod
+    def get_interval():
+        return getattr(settings, 'USERS_DATAFILES_RELOAD_INTERVAL', DEFAULT_RELOAD_INTERVAL)
+
+    def _load(self):
+        paths = self.paths()
+        signature = _signature(paths)
+        return self.loader(), signature
+
+    def get(self):
+        value = self._value
+        if value is None:
+            with self._lock:
+                if self._value is None:
+                    self._value, self._signature = self._load()
+                    self._checked_at = time.monotonic()
+                return self._value
+        interval = self.get_interval()
+        if interval and time.monotonic() - self._checked_at >= interval:
+            self.check()
+        return value
+
+    def check(self):
+        """
+        Start background reload if watched files changed.
+        Returns the reloading thread or ``None``.
+        """
+        self._checked_at = time.monotonic()
+        if _signature(self.paths()) == self._signature:
+            return None
+        # only one reload at a time, readers never wait for it
+        if not self._reloading.acquire(blocking=False):
+            return None
+        thread = threading.Thread(target=self._reload, name='users-datafiles-reload', daemon=True)
+        thread.start()
+        return thread
+
+    def _reload(self):
+        try:
+            value, signature = self._load()
+        except Exception:
+            logger.exception('Reloading %s failed, keeping previous version.', ', '.join(self.paths()))
+            # don't retry until files change again
+            self._signature = _signature(self.paths())
+        else:
+            self._value, self._signature = value, signature
+            self.reloads += 1
+        finally:
+            self._reloading.release()
+
+    def reload(self):
+        """
+        Rebuild index synchronously.
+        """
+        with self._reloading:
+            self._value, self._signature = self._load()
+            self.reloads += 1
+        return self._value
+
+    def reset(self):
+        with self._lock:
+            self._value = None
+            self._signature = None
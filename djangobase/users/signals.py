@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .auth import invalidate_cached_user
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_snapshot(sender, instance, using, **kwargs):
+    # every save bumps the version, which also covers password
+    # changes, so sessions bound to the old hash end at once;
+    # only after commit, until then requests still read and
+    # would cache the old row under the new version
+    pk = instance.pk
+    transaction.on_commit(lambda: invalidate_cached_user(pk), using=using)
@@ -0,0 +1,28 @@
+from django.test import SimpleTestCase
+
+from ..ahocorasick import Automaton
+
+
+class AutomatonTestCase(SimpleTestCase):
+
+    def test_finds_patterns_anywhere_in_text(self):
+        automaton = Automaton(['admin', 'support', 'www'])
+        self.assertEqual(automaton.search('admin1'), 'admin')
+        self.assertEqual(automaton.search('support-team'), 'support')
+        self.assertEqual(automaton.search('my-www-page'), 'www')
+        self.assertIsNone(automaton.search('alice'))
+
+    def test_follows_failure_links(self):
+        automaton = Automaton(['abcd', 'bc'])
+        self.assertEqual(automaton.search('xabcx'), 'bc')
+        automaton = Automaton(['she', 'he', 'hers'])
+        self.assertEqual(automaton.search('ushers'), 'she')
+        self.assertEqual(automaton.search('ahhe'), 'he')
+
+    def test_reports_pattern_ending_inside_longer_one(self):
+        automaton = Automaton(['abcde', 'cd'])
+        self.assertEqual(automaton.search('abcdx'), 'cd')
+
+    def test_empty_patterns(self):
+        self.assertIsNone(Automaton([]).search('admin'))
+        self.assertIsNone(Automaton(['']).search('admin'))
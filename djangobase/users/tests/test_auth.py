@@ -1,11 +1,17 @@
-from django.contrib.auth import authenticate
-from django.test import override_settings
+import asyncio
+
+from django.contrib.auth import authenticate, get_user
+from django.contrib.auth.signals import user_login_failed
+from django.db import transaction
+from django.http import HttpRequest
+from django.test import TransactionTestCase, override_settings
 from hypothesis import (
     settings
 )
 from hypothesis.extra.django import TestCase
 
 from . import factories as ft
+from ..auth import CachedEmailBackend, EmailBackend, _get_version, aauthenticate, get_user_cache
 
 
 @override_settings(
@@ -94,4 +100,122 @@ class EmailBackendTestCase(TestCase):
             email=active_user.email,
             password=ft.DEFAULT_PASSWORD,
         )
-        self.assertIsNone(valid)
\ No newline at end of file
+        self.assertIsNone(valid)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=['users.auth.EmailBackend'],
+    AUTH_PASSWORD_VALIDATORS=[]
+)
+class AsyncEmailBackendTestCase(TransactionTestCase):
+    # users are looked up by executor threads, so they must be committed
+
+    def setUp(self):
+        self.active_user = ft.create_user('Active@Example.com', ft.DEFAULT_PASSWORD, is_active=True)
+        self.inactive_user = ft.create_user('inactive@example.com', ft.DEFAULT_PASSWORD, is_active=False)
+
+    def test_results_match_sync_authenticate(self):
+        cases = [
+            dict(username='Active@example.COM', password=ft.DEFAULT_PASSWORD),
+            dict(email='Active@example.com', password=ft.DEFAULT_PASSWORD),
+            dict(username='Active@example.com', password='wrong'),
+            dict(username='inactive@example.com', password=ft.DEFAULT_PASSWORD),
+            dict(username='missing@example.com', password=ft.DEFAULT_PASSWORD),
+            dict(username='Active@example.com'),
+        ]
+        for credentials in cases:
+            expected = authenticate(**credentials)
+            user = run(aauthenticate(**credentials))
+            self.assertEqual(user, expected, credentials)
+            if user is not None:
+                self.assertEqual(user.backend, 'users.auth.EmailBackend')
+
+    def test_backend_aauthenticate(self):
+        user = run(EmailBackend().aauthenticate(None, email='Active@example.com', password=ft.DEFAULT_PASSWORD))
+        self.assertEqual(user, self.active_user)
+
+    def test_failed_login_sends_signal(self):
+        failures = []
+
+        def handler(**kwargs):
+            failures.append(kwargs['credentials'])
+        user_login_failed.connect(handler)
+        self.addCleanup(user_login_failed.disconnect, handler)
+
+        self.assertIsNone(run(aauthenticate(username='active@example.com', password='wrong')))
+        self.assertEqual(failures, [{'username': 'active@example.com', 'password': '********************'}])
+
+    def test_concurrent_logins(self):
+        async def login_many():
+            return await asyncio.gather(*[
+                aauthenticate(username='Active@example.com', password=password)
+                for password in [ft.DEFAULT_PASSWORD, 'wrong'] * 4
+            ])
+        self.assertEqual(run(login_many()), [self.active_user, None] * 4)
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=['users.auth.CachedEmailBackend'],
+    AUTH_PASSWORD_VALIDATORS=[]
+)
+class CachedEmailBackendTestCase(TransactionTestCase):
+    # snapshots are invalidated on commit
+
+    def setUp(self):
+        get_user_cache().clear()
+        self.user = ft.create_user('user@example.com', ft.DEFAULT_PASSWORD, is_active=True)
+        self.backend = CachedEmailBackend()
+
+    def test_user_is_loaded_once(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+
+    def test_save_invalidates_snapshot(self):
+        self.backend.get_user(self.user.pk)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_snapshot_invalidated_on_commit(self):
+        version = _get_version(get_user_cache(), self.user.pk)
+        with transaction.atomic():
+            self.user.is_active = False
+            self.user.save()
+            self.assertEqual(_get_version(get_user_cache(), self.user.pk), version)
+        self.assertNotEqual(_get_version(get_user_cache(), self.user.pk), version)
+
+    def test_rolled_back_save_keeps_snapshot(self):
+        version = _get_version(get_user_cache(), self.user.pk)
+        with self.assertRaises(ValueError), transaction.atomic():
+            self.user.save()
+            raise ValueError
+        self.assertEqual(_get_version(get_user_cache(), self.user.pk), version)
+
+    def test_delete_invalidates_snapshot(self):
+        self.backend.get_user(self.user.pk)
+        pk = self.user.pk
+        self.user.delete()
+        self.assertIsNone(self.backend.get_user(pk))
+
+    def test_authenticated_requests_make_no_queries(self):
+        self.assertTrue(self.client.login(email='user@example.com', password=ft.DEFAULT_PASSWORD))
+        request = HttpRequest()
+        request.session = self.client.session
+        self.assertEqual(get_user(request), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user(request), self.user)
+
+        self.user.set_password('new_password')
+        self.user.save()
+        self.assertTrue(get_user(request).is_anonymous)
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+
+from .. import blocklist
+
+
+class DomainBlocklistTestCase(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.source = os.path.join(cls.tmp_dir, 'domains.txt')
+        with open(cls.source, 'w', encoding='utf-8') as f:
+            f.write('# comment\nmailinator.com\n\nYOPmail.com  # trailing comment\nмейл.рф\n')
+            for i in range(5000):
+                f.write('throwaway%d.example\n' % i)
+        cls.path = blocklist.build_blocklist(cls.source, os.path.join(cls.tmp_dir, 'domains.bin'))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+        super().tearDownClass()
+
+    def assertBlocklist(self, domains):
+        self.assertEqual(len(domains), 5003)
+        self.assertIn('mailinator.com', domains)
+        self.assertIn('yopmail.COM.', domains)
+        self.assertIn('throwaway4999.example', domains)
+        self.assertIn('xn--e1aigb.xn--p1ai', domains)
+        self.assertNotIn('gmail.com', domains)
+        self.assertNotIn('com', domains)
+
+    def test_compiled_table(self):
+        self.assertBlocklist(blocklist.DomainBlocklist.from_file(self.path))
+
+    def test_in_memory_table(self):
+        self.assertBlocklist(blocklist.DomainBlocklist.from_source(self.source))
+
+    def test_match_checks_parent_domains(self):
+        domains = blocklist.DomainBlocklist.from_file(self.path)
+        self.assertEqual(domains.match('mailinator.com'), 'mailinator.com')
+        self.assertEqual(domains.match('a.b.Mailinator.com'), 'mailinator.com')
+        self.assertIsNone(domains.match('notmailinator.com'))
+        self.assertIsNone(domains.match(''))
+
+    def test_ascii_domains_normalize_like_idna(self):
+        for domain in ('Mailinator.COM.', 'xn--e1aigb.xn--p1ai', 'a..b.com', 'x' * 70 + '.com', ''):
+            with self.subTest(domain=domain):
+                normalized = domain.lower().rstrip('.')
+                try:
+                    expected = normalized.encode('idna')
+                except UnicodeError:
+                    expected = normalized.encode('utf-8')
+                self.assertEqual(blocklist.normalize_domain(domain), expected)
+        self.assertEqual(blocklist.normalize_domain('Мейл.рф'), b'xn--e1aigb.xn--p1ai')
+
+    def test_small_and_empty_tables(self):
+        self.assertIn('mailinator.com', blocklist.DomainBlocklist.from_domains(['mailinator.com']))
+        self.assertNotIn('mailinator.com', blocklist.DomainBlocklist.from_domains([]))
+
+    def test_stale_table_falls_back_to_source(self):
+        source = os.path.join(self.tmp_dir, 'stale.txt')
+        path = os.path.join(self.tmp_dir, 'stale.bin')
+        with open(source, 'w') as f:
+            f.write('mailinator.com\n')
+        blocklist.build_blocklist(source, path)
+        self.assertIsInstance(blocklist.load_blocklist(path, source).fingerprints, memoryview)
+        with open(source, 'a') as f:
+            f.write('yopmail.com\n')
+        os.utime(path, (0, 0))
+        self.assertIn('yopmail.com', blocklist.load_blocklist(path, source))
+
+    def test_missing_table_falls_back_to_source(self):
+        with override_settings(
+            USERS_DISPOSABLE_DOMAINS_TABLE=os.path.join(self.tmp_dir, 'missing.bin'),
+            USERS_DISPOSABLE_DOMAINS_SOURCE=self.source,
+        ):
+            self.assertIn('throwaway1.example', blocklist.get_disposable_domains())
@@ -0,0 +1,29 @@
+from django.test import SimpleTestCase
+
+from ..cache import LRUCache
+
+
+class LRUCacheTestCase(SimpleTestCase):
+
+    def test_counts_hits_and_misses(self):
+        cache = LRUCache(maxsize=2)
+        self.assertEqual(cache.get_or_set('a', str.upper), 'A')
+        self.assertEqual(cache.get_or_set('a', str.upper), 'A')
+        self.assertEqual(cache.info(), {'size': 1, 'maxsize': 2, 'hits': 1, 'misses': 1})
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.get_or_set('a', str.upper)
+        cache.get_or_set('b', str.upper)
+        # touch 'a' so 'b' becomes the oldest entry
+        cache.get_or_set('a', str.upper)
+        cache.get_or_set('c', str.upper)
+        self.assertEqual(len(cache), 2)
+        cache.get_or_set('b', str.upper)
+        self.assertEqual(cache.misses, 4)
+
+    def test_clear(self):
+        cache = LRUCache()
+        cache.get_or_set('a', str.upper)
+        cache.clear()
+        self.assertEqual(cache.info(), {'size': 0, 'maxsize': 1024, 'hits': 0, 'misses': 0})
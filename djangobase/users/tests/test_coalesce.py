@@ -0,0 +1,99 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from ..coalesce import SingleFlight
+
+
+class SingleFlightTestCase(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.flight = SingleFlight()
+        self.calls = 0
+
+    def slow_lookup(self, result, delay=0.1):
+        def lookup():
+            self.calls += 1
+            time.sleep(delay)
+            return result
+        return lookup
+
+    def run_concurrently(self, func, count=5):
+        results = [None] * count
+
+        def target(i):
+            results[i] = func()
+        threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_calls_share_one_lookup(self):
+        lookup = self.slow_lookup(['user'])
+        results = self.run_concurrently(lambda: self.flight.do('key', lookup))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [['user']] * 5)
+        self.assertEqual(self.flight.stats['coalesced'], 4)
+        # waiting callers get copies
+        self.assertEqual(len(set(id(r) for r in results)), 5)
+
+    def test_different_keys_are_not_coalesced(self):
+        self.flight.do('a', self.slow_lookup(1, delay=0))
+        self.flight.do('b', self.slow_lookup(2, delay=0))
+        self.flight.do('a', self.slow_lookup(1, delay=0))
+        self.assertEqual(self.calls, 3)
+
+    def test_errors_are_raised_to_waiting_callers(self):
+        errors = []
+
+        def lookup():
+            time.sleep(0.1)
+            raise ValueError('lookup failed')
+
+        def call():
+            try:
+                self.flight.do('key', lookup)
+            except ValueError as e:
+                errors.append(e)
+        self.run_concurrently(call, count=3)
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(self.flight.do('key', self.slow_lookup('ok', delay=0)), 'ok')
+
+    @override_settings(USERS_COALESCE_CACHE='default')
+    def test_waits_for_lookup_in_other_worker(self):
+        # another worker holds the lock and publishes its result
+        key = self.flight.get_lock_key('key')
+        cache.set(key, 'token', 2)
+
+        def publish():
+            time.sleep(0.1)
+            cache.set('users:flight-result:token', ('shared',), 2)
+            cache.delete(key)
+        threading.Thread(target=publish).start()
+        self.assertEqual(self.flight.do('key', self.slow_lookup('own', delay=0)), 'shared')
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(self.flight.stats['shared'], 1)
+
+    @override_settings(USERS_COALESCE_CACHE='default')
+    def test_queries_when_other_worker_fails(self):
+        key = self.flight.get_lock_key('key')
+        cache.set(key, 'token', 2)
+        threading.Timer(0.1, cache.delete, [key]).start()
+        self.assertEqual(self.flight.do('key', self.slow_lookup('own', delay=0)), 'own')
+        self.assertEqual(self.calls, 1)
+
+    @override_settings(USERS_COALESCE_CACHE='default')
+    def test_lock_is_released(self):
+        self.flight.do('key', self.slow_lookup('own', delay=0))
+        self.assertIsNone(cache.get(self.flight.get_lock_key('key')))
+
+    def test_in_process_only_by_default(self):
+        results = self.run_concurrently(lambda: self.flight.do('key', self.slow_lookup('user')))
+        self.assertEqual(results, ['user'] * 5)
+        self.assertEqual(self.calls, 1)
+        self.assertIsNone(self.flight.get_cache())
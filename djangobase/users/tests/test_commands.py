@@ -0,0 +1,369 @@
+import csv
+import gzip
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import MD5PasswordHasher, SHA1PasswordHasher, check_password, get_hasher
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from . import factories as ft
+from .. import benchmarks, hashing, validators
+from ..hashers import CalibratedPBKDF2PasswordHasher
+from ..management.commands import import_users
+
+UserModel = get_user_model()
+
+
+class BackfillEmailSkeletonsTestCase(TestCase):
+
+    def test_backfills_missing_skeletons(self):
+        for i in range(5):
+            ft.create_user('user%d@example.com' % i, ft.DEFAULT_PASSWORD, is_active=True)
+        UserModel.objects.update(email_skeleton='')
+        out = StringIO()
+        call_command('backfill_email_skeletons', batch_size=2, stdout=out)
+        self.assertIn('checked 5 users, updated 5', out.getvalue())
+        self.assertEqual(
+            list(UserModel.objects.order_by('pk').values_list('email_skeleton', flat=True)),
+            ['userO@exarnple.corn', 'userl@exarnple.corn', 'user2@exarnple.corn',
+             'user3@exarnple.corn', 'user4@exarnple.corn'],
+        )
+        out = StringIO()
+        call_command('backfill_email_skeletons', stdout=out)
+        self.assertIn('checked 5 users, updated 0', out.getvalue())
+
+
+class BenchmarkValidatorsTestCase(SimpleTestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def test_corpora_are_realistic(self):
+        self.assertFalse(any(validators.is_dangerous(v) for v in benchmarks.ascii_emails(100)))
+        self.assertTrue(all(
+            validators.is_dangerous(v.split('@')[0]) for v in benchmarks.mixed_script_emails(100)))
+        self.assertTrue(all(max(v.split('@')[1]) > '\x7f' for v in benchmarks.idn_emails(100)))
+        self.assertGreater(sum(v.lower() in validators.reserved_names.get().index
+                               for v in benchmarks.reserved_usernames(100)), 50)
+
+    def test_saves_and_compares_baseline(self):
+        out = StringIO()
+        call_command('benchmark_validators', count=20, rounds=1, save_baseline=self.path, stdout=out)
+        with open(self.path) as f:
+            baseline = json.load(f)
+        self.assertEqual(set(baseline), set(name for name, _, _ in benchmarks.BENCHMARKS))
+        for result in baseline.values():
+            self.assertLessEqual(result['p50'], result['p90'])
+            self.assertLessEqual(result['p90'], result['p99'])
+            self.assertGreater(result['ops'], 0)
+        self.assertIn('reserved_name/reserved', out.getvalue())
+
+    def test_fails_on_regression(self):
+        with open(self.path, 'w') as f:
+            json.dump({'reserved_name/reserved': {'p50': 1e-6, 'p90': 1e-6, 'p99': 1e-6, 'ops': 1e12}}, f)
+        err = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 benchmark(s) regressed'):
+            call_command('benchmark_validators', count=20, rounds=1, only='reserved_name/',
+                         baseline=self.path, stdout=StringIO(), stderr=err)
+        self.assertIn('reserved_name/reserved', err.getvalue())
+
+    def test_missing_baseline_fails_before_running(self):
+        path = self.path + '.missing'
+        with mock.patch.object(benchmarks, 'run') as run:
+            with self.assertRaisesMessage(CommandError, 'record one first with --save-baseline'):
+                call_command('benchmark_validators', baseline=path, stdout=StringIO())
+        self.assertFalse(run.called)
+
+    def test_compare_ignores_unknown_and_tolerated(self):
+        results = {'a': {'p50': 1.1}, 'b': {'p50': 2.0}}
+        baseline = {'a': {'p50': 1.0}, 'c': {'p50': 1.0}}
+        self.assertEqual(benchmarks.compare(results, baseline, tolerance=0.2), [])
+        self.assertEqual(benchmarks.compare(results, baseline, tolerance=0.05), [('a', 1.0, 1.1)])
+
+
+class CalibrateHashersTestCase(TestCase):
+
+    def test_calibrates_iterations(self):
+        fd, path = tempfile.mkstemp(suffix='.py')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        out = StringIO()
+        call_command('calibrate_hashers', target_ms=5, samples=1, output=path, stdout=out, stderr=StringIO())
+        namespace = {}
+        with open(path) as f:
+            exec(f.read(), namespace)
+        self.assertEqual(namespace['PASSWORD_HASHERS'][0], 'users.hashers.CalibratedPBKDF2PasswordHasher')
+        self.assertEqual(namespace['USERS_PBKDF2_ITERATIONS'] % 1000, 0)
+        self.assertIn('USERS_PBKDF2_ITERATIONS = %d' % namespace['USERS_PBKDF2_ITERATIONS'], out.getvalue())
+
+    def test_verifies_login_latency(self):
+        out = StringIO()
+        call_command('calibrate_hashers', iterations=1000, samples=1, verify_auth=True, auth_samples=5,
+                     budget_ms=10000, stdout=out, stderr=StringIO())
+        self.assertIn('within budget', out.getvalue())
+        self.assertFalse(UserModel.objects.exists())
+        with self.assertRaisesMessage(CommandError, 'exceeds budget'):
+            call_command('calibrate_hashers', iterations=1000, samples=1, verify_auth=True, auth_samples=5,
+                         budget_ms=0, stdout=StringIO(), stderr=StringIO())
+
+    def test_calibrated_hasher(self):
+        hasher = CalibratedPBKDF2PasswordHasher()
+        with self.settings(USERS_PBKDF2_ITERATIONS=2000):
+            encoded = hasher.encode('secret', 'salt')
+            self.assertTrue(encoded.startswith('pbkdf2_sha256$2000$'))
+            self.assertFalse(hasher.must_update(encoded))
+        self.assertTrue(hasher.must_update(encoded))
+        self.assertTrue(hasher.verify('secret', encoded))
+
+    def test_verifies_hashes_of_django_hasher(self):
+        encoded = get_hasher().encode('secret', 'salt')
+        with self.settings(PASSWORD_HASHERS=['users.hashers.CalibratedPBKDF2PasswordHasher'],
+                           USERS_PBKDF2_ITERATIONS=2000):
+            from django.contrib.auth.hashers import check_password
+            updated = []
+            self.assertTrue(check_password('secret', encoded, updated.append))
+            self.assertEqual(updated, ['secret'])
+
+
+@override_settings(PASSWORD_HASHERS=[
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'users.hashers.PBKDF2WrappedSHA1PasswordHasher',
+    'users.hashers.PBKDF2WrappedMD5PasswordHasher',
+    'django.contrib.auth.hashers.SHA1PasswordHasher',
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+])
+class UpgradePasswordHashesTestCase(TestCase):
+
+    def setUp(self):
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'checkpoint')
+        self.users = []
+        for i, hasher in enumerate([SHA1PasswordHasher, MD5PasswordHasher, SHA1PasswordHasher]):
+            user = ft.create_user('user%d@example.com' % i, ft.DEFAULT_PASSWORD, is_active=True)
+            user.password = hasher().encode(ft.DEFAULT_PASSWORD, 'salt%d' % i)
+            user.save()
+            self.users.append(user)
+        self.strong = ft.create_user('strong@example.com', ft.DEFAULT_PASSWORD, is_active=True)
+
+    def passwords(self):
+        return list(UserModel.objects.order_by('pk').values_list('password', flat=True))
+
+    def test_wraps_weak_hashes(self):
+        strong_hash = self.strong.password
+        out = StringIO()
+        call_command('upgrade_password_hashes', batch_size=2, workers=2, checkpoint=self.checkpoint, stdout=out)
+        self.assertIn('Done: upgraded 3 users.', out.getvalue())
+        passwords = self.passwords()
+        self.assertEqual([p.split('$')[0] for p in passwords],
+                         ['pbkdf2_wrapped_sha1', 'pbkdf2_wrapped_md5', 'pbkdf2_wrapped_sha1', 'pbkdf2_sha256'])
+        self.assertEqual(passwords[3], strong_hash)
+        for password in passwords:
+            self.assertTrue(check_password(ft.DEFAULT_PASSWORD, password))
+            self.assertFalse(check_password('wrong', password))
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+        out = StringIO()
+        call_command('upgrade_password_hashes', workers=0, checkpoint=self.checkpoint, stdout=out)
+        self.assertIn('Done: upgraded 0 users.', out.getvalue())
+
+    def test_resumes_from_checkpoint(self):
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'last_pk': self.users[0].pk, 'upgraded': 1}, f)
+        out = StringIO()
+        call_command('upgrade_password_hashes', workers=0, checkpoint=self.checkpoint, stdout=out)
+        self.assertIn('Resuming after pk %d.' % self.users[0].pk, out.getvalue())
+        self.assertIn('Done: upgraded 3 users.', out.getvalue())
+        self.assertEqual([p.split('$')[0] for p in self.passwords()],
+                         ['sha1', 'pbkdf2_wrapped_md5', 'pbkdf2_wrapped_sha1', 'pbkdf2_sha256'])
+
+    def test_requires_wrapped_hashers(self):
+        with self.settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher']):
+            with self.assertRaisesMessage(CommandError, 'users.hashers.PBKDF2WrappedSHA1PasswordHasher'):
+                call_command('upgrade_password_hashes', workers=0, checkpoint=self.checkpoint)
+        self.assertEqual(self.passwords()[0].split('$')[0], 'sha1')
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ImportUsersTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def import_users(self, path, **options):
+        out = StringIO()
+        options.setdefault('workers', 0)
+        call_command('import_users', path, stdout=out, **options)
+        return out.getvalue()
+
+    def test_imports_csv(self):
+        path = self.write('users.csv', 'email,password,is_active\n'
+                                       'jan@X.pl,secret,1\n'
+                                       'anna@x.pl,,\n')
+        out = self.import_users(path)
+        self.assertIn('Done: 2 rows, created 2 users, rejected 0.', out)
+        self.assertIn('rows/s', out)
+        jan = UserModel.objects.get(email='jan@x.pl')
+        self.assertTrue(jan.is_active)
+        self.assertTrue(jan.check_password('secret'))
+        anna = UserModel.objects.get(email='anna@x.pl')
+        self.assertFalse(anna.is_active)
+        self.assertFalse(anna.has_usable_password())
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+    def test_rejects_invalid_rows(self):
+        ft.create_user('taken@x.pl', ft.DEFAULT_PASSWORD, is_active=True)
+        path = self.write('users.jsonl', '\n'.join([
+            json.dumps({'email': 'jan@x.pl', 'password': 'secret'}),
+            '{broken',
+            json.dumps({'email': 'not an email'}),
+            json.dumps({'email': 'jan@pаypal.com'}),  # Cyrillic 'а'
+            json.dumps({'email': 'TAKEN@x.pl'}),
+            json.dumps({'email': 'anna@x.pl', 'nickname': 'anna'}),
+            json.dumps({'password': 'secret'}),
+            json.dumps({'email': 'jan@mailinator.com'}),
+            json.dumps({'email': 'anna@mailinator.com'}),
+        ]) + '\n')
+        rejects = os.path.join(self.dir.name, 'rejects.jsonl')
+        out = self.import_users(path, rejects=rejects)
+        self.assertIn('created 1 users, rejected 8 (confusable_email 1, disposable_email 2, duplicate 1, '
+                      'invalid 1, malformed 1, required 1, unknown_field 1)', out)
+        with open(rejects) as f:
+            rejected = [json.loads(line) for line in f]
+        self.assertEqual(sorted((r['row'], r['code']) for r in rejected), [
+            (2, 'malformed'), (3, 'invalid'), (4, 'confusable_email'), (5, 'duplicate'),
+            (6, 'unknown_field'), (7, 'required'), (8, 'disposable_email'), (9, 'disposable_email'),
+        ])
+        self.assertNotIn('password', json.dumps(rejected))
+
+    def test_imports_hashed_passwords(self):
+        encoded = MD5PasswordHasher().encode('secret', 'salt')
+        path = self.write('users.jsonl', '\n'.join([
+            json.dumps({'email': 'jan@x.pl', 'password': encoded}),
+            json.dumps({'email': 'anna@x.pl', 'password': 'secret'}),
+        ]))
+        out = self.import_users(path, hashed=True)
+        self.assertIn('created 1 users, rejected 1 (invalid_hash 1)', out)
+        self.assertEqual(UserModel.objects.get().password, encoded)
+
+    def test_rejects_hashed_passwords_which_are_not_strings(self):
+        path = self.write('users.jsonl', '\n'.join([
+            json.dumps({'email': 'jan@x.pl', 'password': None}),
+            json.dumps({'email': 'anna@x.pl', 'password': 123}),
+        ]))
+        out = self.import_users(path, hashed=True)
+        self.assertIn('created 0 users, rejected 2 (invalid_hash 2)', out)
+
+    def test_rejects_duplicates_differing_in_case(self):
+        ft.create_user('Taken@x.pl', ft.DEFAULT_PASSWORD, is_active=True)
+        path = self.write('users.csv', 'email\n'
+                                       'Jan@x.pl\n'
+                                       'jan@x.pl\n'
+                                       'taken@x.pl\n'
+                                       'JAN@x.pl\n')
+        rejects = os.path.join(self.dir.name, 'rejects.jsonl')
+        out = self.import_users(path, rejects=rejects)
+        self.assertIn('created 1 users, rejected 3 (duplicate 3)', out)
+        with open(rejects) as f:
+            self.assertEqual(sorted(json.loads(line)['row'] for line in f), [2, 3, 4])
+        self.assertEqual(UserModel.objects.get(email__iexact='jan@x.pl').email, 'Jan@x.pl')
+
+    def test_resumes_from_checkpoint(self):
+        path = self.write('users.csv', 'email\n' + ''.join('user%d@x.pl\n' % i for i in range(5)))
+        with open(path + '.checkpoint', 'w') as f:
+            json.dump({'source': path, 'row': 3, 'created': 3, 'rejected': {}}, f)
+        out = self.import_users(path, batch_size=1)
+        self.assertIn('Resuming after row 3.', out)
+        self.assertIn('Done: 5 rows, created 5 users', out)
+        self.assertEqual(sorted(UserModel.objects.values_list('email', flat=True)), ['user3@x.pl', 'user4@x.pl'])
+
+    def test_writes_checkpoint_per_batch(self):
+        path = self.write('users.csv', 'email\n' + ''.join('user%d@x.pl\n' % i for i in range(5)))
+        checkpoints = []
+        write_checkpoint = import_users.write_checkpoint
+
+        def record(checkpoint_path, checkpoint):
+            checkpoints.append(checkpoint['row'])
+            write_checkpoint(checkpoint_path, checkpoint)
+        with mock.patch.object(import_users, 'write_checkpoint', record):
+            self.import_users(path, batch_size=2)
+        self.assertEqual(checkpoints, [2, 4, 5])
+
+    def test_hashes_all_batches_in_one_pool(self):
+        path = self.write('users.csv', 'email,password\n' + ''.join('user%d@x.pl,secret\n' % i for i in range(5)))
+        pool = mock.Mock(wraps=ThreadPoolExecutor)
+        with mock.patch.object(hashing, 'ProcessPoolExecutor', pool):
+            out = self.import_users(path, batch_size=2, workers=2)
+        self.assertIn('created 5 users', out)
+        self.assertEqual(pool.call_count, 1)
+        self.assertTrue(UserModel.objects.get(email='user4@x.pl').check_password('secret'))
+
+    def test_rejects_checkpoint_of_other_file(self):
+        path = self.write('users.csv', 'email\n')
+        with open(path + '.checkpoint', 'w') as f:
+            json.dump({'source': '/other.csv', 'row': 3, 'created': 3, 'rejected': {}}, f)
+        with self.assertRaises(CommandError):
+            self.import_users(path)
+
+
+class ExportUsersTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.users = [ft.create_user('user%d@x.pl' % i, ft.DEFAULT_PASSWORD, is_active=i % 2 == 0) for i in range(3)]
+
+    def export_users(self, name, **options):
+        path = os.path.join(self.dir.name, name)
+        out = StringIO()
+        call_command('export_users', path, stdout=out, **options)
+        self.assertIn('Done: exported 3 users to %s' % path, out.getvalue())
+        self.assertEqual(os.listdir(self.dir.name), [name])
+        return path
+
+    def test_exports_jsonl(self):
+        path = self.export_users('users.jsonl', batch_size=2)
+        with open(path) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row['email'] for row in rows], ['user0@x.pl', 'user1@x.pl', 'user2@x.pl'])
+        self.assertEqual(rows[0]['id'], self.users[0].pk)
+        self.assertIs(rows[1]['is_active'], False)
+        self.assertNotIn('password', rows[0])
+
+    def test_exports_gzipped_csv(self):
+        path = self.export_users('users.csv.gz', fields='email,is_active')
+        with gzip.open(path, 'rt', newline='') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(rows[0], {'email': 'user0@x.pl', 'is_active': 'True'})
+        self.assertEqual(len(rows), 3)
+
+    def test_gzip_option(self):
+        path = self.export_users('users', gzip=True, format='csv')
+        with gzip.open(path, 'rt') as f:
+            self.assertTrue(f.readline().startswith('id,'))
+
+    def test_export_can_be_imported(self):
+        path = self.export_users('users.jsonl', fields='email,password,is_active')
+        passwords = dict(UserModel.objects.values_list('email', 'password'))
+        UserModel.objects.all().delete()
+        call_command('import_users', path, hashed=True, workers=0, stdout=StringIO())
+        self.assertEqual(dict(UserModel.objects.values_list('email', 'password')), passwords)
+        self.assertEqual(UserModel.objects.filter(is_active=True).count(), 2)
+
+    def test_rejects_unknown_fields(self):
+        with self.assertRaisesMessage(CommandError, 'Unknown fields: nickname.'):
+            call_command('export_users', os.path.join(self.dir.name, 'users.csv'), fields='email,nickname')
+        self.assertEqual(os.listdir(self.dir.name), [])
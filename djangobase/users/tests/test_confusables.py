@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+
+from confusable_homoglyphs import categories, confusables as library
+from django.test import SimpleTestCase, override_settings
+
+from .. import confusables
+
+
+class ConfusablesTableTestCase(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.path = confusables.build_table(os.path.join(cls.tmp_dir, 'confusables.bin'))
+        cls.table = confusables.ConfusablesTable(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+        super().tearDownClass()
+
+    def test_table_has_same_aliases_as_library(self):
+        code_points = set()
+        for start, end, _, _ in categories.categories_data['code_points_ranges']:
+            code_points.update((start - 1, start, end, end + 1))
+        for code_point in sorted(code_points & set(range(0x110000))):
+            char = chr(code_point)
+            with self.subTest(code_point=code_point):
+                self.assertEqual(self.table.alias(char), categories.alias(char))
+
+    def test_table_has_same_confusables_as_library(self):
+        for char in library.confusables_data:
+            if len(char) != 1:
+                continue
+            with self.subTest(char=char):
+                self.assertTrue(self.table.is_confusable(char))
+        self.assertFalse(self.table.is_confusable('ż'))
+
+    def test_table_gives_same_verdict_as_library(self):
+        values = [
+            'Allo', 'AlloΓ', 'Alloρ', 'AlaskaJazz', 'ΑlaskaJazz', 'ρτ.τ', 'B. C',
+            u'pаypаl', u'gооgle', u'ρayρal',
+            'gmail.com', u'exаmple.com', 'żółć', '日本語abc', '',
+        ]
+        for value in values:
+            with self.subTest(value=value):
+                self.assertEqual(
+                    self.table.is_dangerous(value),
+                    bool(library.is_dangerous(value)),
+                )
+
+    def test_table_has_same_prototypes_as_library(self):
+        prototypes = confusables.prototypes(library.confusables_data)
+        for char, prototype in prototypes.items():
+            with self.subTest(char=char):
+                self.assertEqual(self.table.prototype(char), prototype)
+        self.assertEqual(self.table.prototype('a'), 'a')
+        self.assertEqual(confusables.LibraryTable().prototype(u'а'), 'a')
+
+    def test_skeleton(self):
+        self.assertEqual(confusables.skeleton(u'pаypаl'), 'paypal')
+        self.assertEqual(confusables.skeleton('rnail'), confusables.skeleton('mail'))
+        self.assertEqual(confusables.skeleton('paypaI'), confusables.skeleton('paypal'))
+        self.assertNotEqual(confusables.skeleton('paypal'), confusables.skeleton('paypa'))
+        self.assertEqual(confusables.skeleton(''), '')
+
+    def test_load_table_falls_back_to_library(self):
+        self.assertIsInstance(
+            confusables.load_table(os.path.join(self.tmp_dir, 'missing.bin')),
+            confusables.LibraryTable,
+        )
+        corrupted = os.path.join(self.tmp_dir, 'corrupted.bin')
+        with open(corrupted, 'wb') as f:
+            f.write(b'UCNF')
+        self.assertIsInstance(confusables.load_table(corrupted), confusables.LibraryTable)
+
+    def test_table_is_loaded_lazily_from_setting(self):
+        with override_settings(USERS_CONFUSABLES_TABLE=self.path):
+            self.assertIsNone(confusables._table)
+            self.assertTrue(confusables.is_dangerous(u'pаypаl'))
+            self.assertIsInstance(confusables._table, confusables.ConfusablesTable)
@@ -1,5 +1,7 @@
+import asyncio
+
 from django.contrib.auth import authenticate
-from django.test import override_settings
+from django.test import TransactionTestCase, override_settings
 from hypothesis import (
     settings, reproduce_failure
 )
@@ -63,6 +65,28 @@ class RegistrationFormTestCase(TestCase):
             validators.validate_confusables_email in
             form.fields['email'].validators
         )
+        self.assertTrue(
+            validators.validate_disposable_email in
+            form.fields['email'].validators
+        )
+
+    def test_form_is_invalid_with_disposable_email(self):
+        self.assertFormInvalid(ft.create_registration_post_data('alice@mailinator.com', ft.DEFAULT_PASSWORD))
+
+    def test_form_is_invalid_with_lookalike_email(self):
+        ft.create_user('jan.kowalski@example.com', ft.DEFAULT_PASSWORD, is_active=True)
+        for email in ('jan.kowaIski@example.com', 'jan.kowalski@exarnple.com'):
+            with self.subTest(email=email):
+                form = RegistrationForm(ft.create_registration_post_data(email, ft.DEFAULT_PASSWORD))
+                self.assertFalse(form.is_valid())
+                self.assertEqual(form.errors.as_data()['email'][0].code, 'lookalike_email')
+        self.assertFormValid(ft.create_registration_post_data('jan.nowak@example.com', ft.DEFAULT_PASSWORD))
+
+    def test_form_is_invalid_with_email_differing_in_case(self):
+        ft.create_user('Jan.Kowalski@example.com', ft.DEFAULT_PASSWORD, is_active=True)
+        form = RegistrationForm(ft.create_registration_post_data('jan.kowalski@EXAMPLE.com', ft.DEFAULT_PASSWORD))
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['email'][0].code, 'duplicate_email')
 
     @ft.given_user_registration_data
     def test_form_is_valid(self, post_data):
@@ -310,3 +334,41 @@ class AuthenticationFormTestCase(TestCase):
                 password='not_default_password12',
             )
         )
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=['users.auth.EmailBackend'],
+    AUTH_PASSWORD_VALIDATORS=[]
+)
+class AsyncAuthenticationFormTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.user = ft.create_user('user@example.com', ft.DEFAULT_PASSWORD, is_active=True)
+
+    def ais_valid(self, form):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(form.ais_valid())
+        finally:
+            loop.close()
+
+    def test_same_result_as_is_valid(self):
+        cases = [
+            dict(email='user@example.com', password=ft.DEFAULT_PASSWORD),
+            dict(email='user@EXAMPLE.com', password=ft.DEFAULT_PASSWORD),
+            dict(email='user@example.com', password='wrong'),
+            dict(email='other@example.com', password=ft.DEFAULT_PASSWORD),
+            dict(email='not an email', password=ft.DEFAULT_PASSWORD),
+            dict(email='user@example.com', password=''),
+        ]
+        for data in cases:
+            form, aform = AuthenticationForm(data=data), AuthenticationForm(data=data)
+            self.assertEqual(self.ais_valid(aform), form.is_valid(), data)
+            self.assertEqual(aform.errors, form.errors, data)
+            self.assertEqual(aform.user_cache, form.user_cache, data)
+
+    def test_invalid_login_is_non_field_error(self):
+        form = AuthenticationForm(data=dict(email='user@example.com', password='wrong'))
+        self.assertFalse(self.ais_valid(form))
+        self.assertEqual(form.non_field_errors().as_data()[0].code, 'invalid_login')
+        self.assertIsNone(form.user_cache)
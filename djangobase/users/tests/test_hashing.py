@@ -0,0 +1,99 @@
+import time
+from unittest import mock
+
+from django.contrib.auth import hashers
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from . import factories as ft
+from .. import hashing
+
+
+class HashingServiceTestCase(SimpleTestCase):
+
+    def get_service(self, **kwargs):
+        service = hashing.HashingService(**kwargs)
+        self.addCleanup(service.shutdown)
+        return service
+
+    def test_hashes_in_pool(self):
+        service = self.get_service(pool_size=2)
+        encoded = service.make_password('secret')
+        self.assertTrue(hashers.check_password('secret', encoded))
+        self.assertTrue(service.check_password('secret', encoded))
+        self.assertFalse(service.check_password('wrong', encoded))
+        self.assertEqual(service.stats['pool'], 3)
+        self.assertEqual(service.stats['inline'], 0)
+
+    def test_inline_without_pool(self):
+        service = self.get_service(pool_size=0)
+        encoded = service.make_password('secret')
+        self.assertTrue(service.check_password('secret', encoded))
+        self.assertEqual(service.stats['inline'], 2)
+        self.assertIsNone(service._pool)
+
+    def test_unusable_password(self):
+        service = self.get_service(pool_size=1)
+        encoded = service.make_password(None)
+        self.assertFalse(hashers.is_password_usable(encoded))
+        self.assertFalse(service.check_password('secret', encoded))
+        self.assertFalse(service.check_password(None, service.make_password('secret')))
+        self.assertEqual(service.stats['pool'], 1)
+
+    def test_setter_called_for_outdated_hash(self):
+        service = self.get_service(pool_size=1)
+        encoded = hashers.PBKDF2PasswordHasher().encode('secret', 'salt', iterations=1000)
+        updated = []
+        self.assertTrue(service.check_password('secret', encoded, updated.append))
+        self.assertEqual(updated, ['secret'])
+        self.assertFalse(service.check_password('wrong', encoded, updated.append))
+        self.assertTrue(service.check_password('secret', service.make_password('secret'), updated.append))
+        self.assertEqual(updated, ['secret'])
+
+    def test_falls_back_inline_when_queue_is_full(self):
+        service = self.get_service(pool_size=1, queue_size=1)
+        service._slots.acquire()
+        self.assertTrue(hashers.check_password('secret', service.make_password('secret')))
+        self.assertEqual(service.stats['queue_full'], 1)
+        self.assertEqual(service.stats['inline'], 1)
+
+    def test_falls_back_inline_on_timeout(self):
+        service = self.get_service(pool_size=1, timeout=0)
+        with self.assertLogs('users.hashing', 'WARNING'):
+            encoded = service.make_password('secret')
+        self.assertTrue(hashers.check_password('secret', encoded))
+        self.assertEqual(service.stats['timeout'], 1)
+
+    def test_slot_held_until_timed_out_worker_finishes(self):
+        service = self.get_service(pool_size=1, queue_size=1, timeout=0.05)
+        with mock.patch.object(service, '_inline', return_value='inline'), self.assertLogs('users.hashing'):
+            self.assertEqual(service._run(time.sleep, 0.5), 'inline')
+        # worker is still sleeping
+        self.assertFalse(service._slots.acquire(blocking=False))
+        service.shutdown(wait=True)
+        self.assertTrue(service._slots.acquire(blocking=False))
+
+    def test_service_reset_on_settings_change(self):
+        with self.settings(USERS_HASHING_POOL_SIZE=3):
+            self.assertEqual(hashing.get_service().pool_size, 3)
+        self.assertEqual(hashing.get_service().pool_size, hashing.DEFAULT_POOL_SIZE)
+
+
+@override_settings(USERS_HASHING_POOL_SIZE=1)
+class UserHashingTestCase(TestCase):
+
+    def test_user_passwords_hashed_in_pool(self):
+        hashed = hashing.get_service().stats['pool']
+        user = ft.create_user('user@example.com', ft.DEFAULT_PASSWORD, is_active=True)
+        self.assertTrue(user.check_password(ft.DEFAULT_PASSWORD))
+        self.assertFalse(user.check_password('wrong'))
+        user.set_password('new_password')
+        self.assertTrue(user.check_password('new_password'))
+        self.assertEqual(hashing.get_service().stats['pool'] - hashed, 5)
+
+    def test_outdated_hash_is_upgraded(self):
+        user = ft.create_user('user@example.com', ft.DEFAULT_PASSWORD, is_active=True)
+        user.password = hashers.PBKDF2PasswordHasher().encode(ft.DEFAULT_PASSWORD, 'salt', iterations=1000)
+        user.save()
+        self.assertTrue(user.check_password(ft.DEFAULT_PASSWORD))
+        user.refresh_from_db()
+        self.assertFalse(hashers.get_hasher().must_update(user.password))
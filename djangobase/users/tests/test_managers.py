@@ -1,9 +1,19 @@
-from django.contrib.auth import get_user_model
-from django.test import override_settings
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock, skipUnless
+
+from django.contrib.auth import authenticate, get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.db.backends.utils import CursorWrapper
+from django.db.models.signals import post_save
+from django.test import TestCase as DjangoTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from hypothesis.extra.django import TestCase
 
 from . import factories as ft
-from ..managers import UserManager
+from .. import hashing
+from ..managers import UserManager, supports_insert_returning
 
 
 class UserManagerTestCase(TestCase):
@@ -143,3 +153,299 @@ class UserManagerTestCase(TestCase):
             password=ft.DEFAULT_PASSWORD,
         )
         self.assertTrue(user.is_superuser)
+
+
+class UserManagerEmailLookupTestCase(DjangoTestCase):
+    UserModel = get_user_model()
+
+    def setUp(self):
+        self.user = ft.create_user('Jan@x.pl', ft.DEFAULT_PASSWORD, is_active=True)
+
+    def test_get_by_email_ignores_case(self):
+        for email in ['Jan@x.pl', 'jan@x.pl', 'JAN@X.PL']:
+            self.assertEqual(self.UserModel.objects.get_by_email(email), self.user)
+            self.assertEqual(self.UserModel.objects.get_by_natural_key(email), self.user)
+        with self.assertRaises(self.UserModel.DoesNotExist):
+            self.UserModel.objects.get_by_email('jan@x.pl', is_active=False)
+
+    def test_case_duplicates_are_rejected(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ft.create_user('jan@X.pl', ft.DEFAULT_PASSWORD, is_active=True)
+
+    def test_lookup_uses_index(self):
+        queryset = self.UserModel.objects.filter_by_email('JAN@x.pl')
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('users_user_email_lower_uniq', plan)
+        self.assertNotIn('SCAN', plan.replace('SCAN CONSTANT', ''))
+
+    def test_authenticate_ignores_case(self):
+        with self.settings(AUTHENTICATION_BACKENDS=['users.auth.EmailBackend']):
+            self.assertEqual(authenticate(username='JAN@x.pl', password=ft.DEFAULT_PASSWORD), self.user)
+
+    def test_duplicates_report(self):
+        migration = import_module('users.migrations.0003_user_email_lower_unique')
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX users_user_email_lower_uniq')
+        duplicate = ft.create_user('JAN@x.pl', ft.DEFAULT_PASSWORD, is_active=False)
+        ft.create_user('other@x.pl', ft.DEFAULT_PASSWORD, is_active=False)
+        duplicates = migration.find_duplicates(self.UserModel)
+        self.assertEqual(duplicates, {'jan@x.pl': [self.user, duplicate]})
+        report = migration.render_report(duplicates)
+        self.assertIn('keep   pk=%d email=Jan@x.pl' % self.user.pk, report)
+        self.assertIn('remove pk=%d email=JAN@x.pl' % duplicate.pk, report)
+
+
+class UserManagerAuthenticationFieldsTestCase(DjangoTestCase):
+    UserModel = get_user_model()
+
+    def setUp(self):
+        self.user = ft.create_user('jan@x.pl', ft.DEFAULT_PASSWORD, is_active=False)
+
+    @staticmethod
+    def selected_columns(sql):
+        return sql.split(' FROM ')[0].count(',') + 1
+
+    def test_loads_only_authentication_fields(self):
+        with CaptureQueriesContext(connection) as full:
+            self.UserModel.objects.get_by_email('jan@x.pl')
+        with CaptureQueriesContext(connection) as narrow:
+            user = self.UserModel.objects.get_for_authentication('JAN@x.pl', is_active=False)
+        self.assertEqual(len(narrow), 1)
+        self.assertNotIn('date_joined', narrow[0]['sql'])
+        self.assertNotIn('email_skeleton', narrow[0]['sql'])
+        self.assertLess(self.selected_columns(narrow[0]['sql']), self.selected_columns(full[0]['sql']))
+        self.assertEqual(user.get_deferred_fields(), {'date_joined', 'email_skeleton', 'is_staff', 'is_superuser'})
+        with self.assertNumQueries(1):
+            self.assertEqual(user.date_joined, self.user.date_joined)
+
+    def test_authenticate_makes_one_narrow_query(self):
+        self.UserModel.objects.filter(pk=self.user.pk).update(is_active=True)
+        with self.settings(AUTHENTICATION_BACKENDS=['users.auth.EmailBackend']):
+            with CaptureQueriesContext(connection) as queries:
+                user = authenticate(username='jan@x.pl', password=ft.DEFAULT_PASSWORD)
+        self.assertEqual(user, self.user)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('date_joined', queries[0]['sql'])
+
+    def test_save_updates_loaded_fields(self):
+        user = self.UserModel.objects.get_for_authentication('jan@x.pl')
+        user.is_active = True
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertNotIn('date_joined', queries[0]['sql'])
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+        self.assertEqual(self.user.email_skeleton, self.user.get_email_skeleton('jan@x.pl'))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UserManagerBulkCreateTestCase(DjangoTestCase):
+    UserModel = get_user_model()
+
+    def test_creates_users_in_chunks(self):
+        users = ({'email': 'user%d@X.pl' % i, 'password': 'secret%d' % i} for i in range(5))
+        # per chunk: one query for taken emails, one INSERT (and savepoint)
+        with CaptureQueriesContext(connection) as queries:
+            result = self.UserModel.objects.bulk_create_users(users, chunk_size=2, workers=0)
+        self.assertEqual(result.created, 5)
+        self.assertEqual(result.duplicates, [])
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('INSERT')]), 3)
+        user = self.UserModel.objects.get(email='user3@x.pl')
+        self.assertTrue(user.check_password('secret3'))
+        self.assertEqual(user.email_skeleton, user.get_email_skeleton(user.email))
+
+    def test_applies_create_user_defaults(self):
+        self.UserModel.objects.bulk_create_users([
+            {'email': 'jan@x.pl', 'password': 'secret'},
+            {'email': 'anna@x.pl', 'password': None, 'is_active': True},
+        ], workers=0)
+        jan = self.UserModel.objects.get(email='jan@x.pl')
+        self.assertEqual((jan.is_active, jan.is_staff, jan.is_superuser), (False, False, False))
+        anna = self.UserModel.objects.get(email='anna@x.pl')
+        self.assertTrue(anna.is_active)
+        self.assertFalse(anna.has_usable_password())
+
+    def test_reports_duplicates(self):
+        ft.create_user('Jan@x.pl', ft.DEFAULT_PASSWORD, is_active=True)
+        result = self.UserModel.objects.bulk_create_users([
+            {'email': 'JAN@x.pl', 'password': 'secret'},
+            {'email': 'anna@x.pl', 'password': 'secret'},
+            {'email': 'Anna@X.PL', 'password': 'secret'},
+        ], workers=0)
+        self.assertEqual(result.created, 1)
+        self.assertEqual(sorted(result.duplicates), ['Anna@x.pl', 'JAN@x.pl'])
+        self.assertEqual(self.UserModel.objects.count(), 2)
+
+    def test_reports_emails_taken_while_hashing(self):
+        make_passwords = hashing.make_passwords
+
+        def hash_and_race(passwords, executor):
+            ft.create_user('jan@x.pl', ft.DEFAULT_PASSWORD, is_active=True)
+            return make_passwords(passwords, executor)
+        with mock.patch.object(hashing, 'make_passwords', hash_and_race):
+            result = self.UserModel.objects.bulk_create_users([
+                {'email': 'jan@x.pl', 'password': 'secret'},
+                {'email': 'anna@x.pl', 'password': 'secret'},
+            ], workers=0)
+        self.assertEqual(result.created, 1)
+        self.assertEqual(result.duplicates, ['jan@x.pl'])
+        self.assertTrue(self.UserModel.objects.get(email='anna@x.pl').check_password('secret'))
+
+    def test_hashes_in_worker_processes(self):
+        result = self.UserModel.objects.bulk_create_users(
+            [{'email': 'user%d@x.pl' % i, 'password': 'secret%d' % i} for i in range(10)], workers=2,
+        )
+        self.assertEqual(result.created, 10)
+        for user in self.UserModel.objects.all():
+            self.assertTrue(user.check_password('secret' + user.email[4:-5]))
+
+    def test_requires_email(self):
+        with self.assertRaises(ValueError):
+            self.UserModel.objects.bulk_create_users([{'email': '', 'password': 'secret'}], workers=0)
+
+
+class UserManagerIterByPkTestCase(DjangoTestCase):
+    UserModel = get_user_model()
+
+    def test_pages_by_primary_key(self):
+        users = [ft.create_user('user%d@x.pl' % i, ft.DEFAULT_PASSWORD, is_active=True) for i in range(5)]
+        # two full pages, a short one ends it
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(self.UserModel.objects.iter_by_pk(['email'], batch_size=2))
+        self.assertEqual(rows, [{'email': user.email} for user in users])
+        self.assertEqual(len(queries), 3)
+        self.assertIn('LIMIT 2', queries[-1]['sql'])
+        self.assertIn('"id" > %d' % users[3].pk, queries[-1]['sql'])
+
+    def test_empty_table(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(list(self.UserModel.objects.iter_by_pk(['email'])), [])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UserManagerGetOrCreateTestCase(DjangoTestCase):
+    UserModel = get_user_model()
+
+    def get_or_create_user(self, *args, **kwargs):
+        with mock.patch.object(hashing, 'make_password', wraps=hashing.make_password) as make_password:
+            result = self.UserModel.objects.get_or_create_user(*args, **kwargs)
+        self.assertEqual(make_password.call_count, 1)
+        return result
+
+    @skipUnless(supports_insert_returning(connection), 'INSERT ... ON CONFLICT ... RETURNING is not supported.')
+    def test_creates_user_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            user, created = self.get_or_create_user('jan@X.pl', 'secret')
+        self.assertTrue(created)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('ON CONFLICT (LOWER("email")) DO NOTHING RETURNING', queries[0]['sql'])
+        self.assertEqual(self.UserModel.objects.get(pk=user.pk), user)
+        user = self.UserModel.objects.get(pk=user.pk)
+        self.assertEqual(user.email, 'jan@x.pl')
+        self.assertTrue(user.check_password('secret'))
+        self.assertEqual((user.is_active, user.is_staff, user.is_superuser), (False, False, False))
+        self.assertEqual(user.email_skeleton, user.get_email_skeleton('jan@x.pl'))
+        self.assertIsNotNone(user.date_joined)
+
+    @skipUnless(supports_insert_returning(connection), 'INSERT ... ON CONFLICT ... RETURNING is not supported.')
+    def test_returns_user_inserted_concurrently(self):
+        existing = ft.create_user('jan@x.pl', ft.DEFAULT_PASSWORD, is_active=True)
+        execute = CursorWrapper.execute
+
+        def race(cursor, sql, params=None):
+            # the other insert won on the unique index of email
+            if 'ON CONFLICT' in sql:
+                raise IntegrityError('UNIQUE constraint failed: users_user.email')
+            return execute(cursor, sql, params)
+        with mock.patch.object(CursorWrapper, 'execute', race):
+            user, created = self.get_or_create_user('jan@x.pl', 'secret')
+        self.assertFalse(created)
+        self.assertEqual(user, existing)
+
+    @skipUnless(supports_insert_returning(connection), 'INSERT ... ON CONFLICT ... RETURNING is not supported.')
+    def test_other_integrity_errors_are_raised(self):
+        execute = CursorWrapper.execute
+
+        def fail(cursor, sql, params=None):
+            if 'ON CONFLICT' in sql:
+                raise IntegrityError('CHECK constraint failed')
+            return execute(cursor, sql, params)
+        with mock.patch.object(CursorWrapper, 'execute', fail):
+            with self.assertRaises(IntegrityError):
+                self.UserModel.objects._insert_if_absent(self.UserModel(email='jan@x.pl'))
+
+    def test_returns_existing_user(self):
+        existing = ft.create_user('Jan@x.pl', ft.DEFAULT_PASSWORD, is_active=True)
+        with CaptureQueriesContext(connection) as queries:
+            user, created = self.get_or_create_user('JAN@x.pl', 'secret', is_active=False)
+        self.assertFalse(created)
+        self.assertEqual(user, existing)
+        self.assertTrue(user.is_active)
+        self.assertTrue(user.check_password(ft.DEFAULT_PASSWORD))
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(self.UserModel.objects.count(), 1)
+
+    def test_sends_save_signals(self):
+        handler = mock.Mock()
+        post_save.connect(handler, sender=self.UserModel)
+        self.addCleanup(post_save.disconnect, handler, sender=self.UserModel)
+        user, created = self.get_or_create_user('jan@x.pl', is_active=True)
+        handler.assert_called_once_with(
+            signal=post_save, sender=self.UserModel, instance=user, created=True,
+            update_fields=None, raw=False, using='default',
+        )
+        self.get_or_create_user('jan@x.pl')
+        self.assertEqual(handler.call_count, 1)
+
+    def test_fallback(self):
+        existing = ft.create_user('jan@x.pl', ft.DEFAULT_PASSWORD, is_active=True)
+        with mock.patch('users.managers.supports_insert_returning', return_value=False):
+            self.assertEqual(self.get_or_create_user('JAN@x.pl', 'secret'), (existing, False))
+            user, created = self.get_or_create_user('anna@x.pl', 'secret')
+        self.assertTrue(created)
+        self.assertEqual(self.UserModel.objects.get(email='anna@x.pl'), user)
+
+    def test_requires_email(self):
+        with self.assertRaises(ValueError):
+            self.UserModel.objects.get_or_create_user('', 'secret')
+
+
+class UserQuerySetTestCase(DjangoTestCase):
+    UserModel = get_user_model()
+
+    def setUp(self):
+        self.active = ft.create_user('active@x.pl', ft.DEFAULT_PASSWORD, is_active=True)
+        self.pending = ft.create_user('pending@x.pl', ft.DEFAULT_PASSWORD, is_active=False)
+        self.stale = ft.create_user('stale@x.pl', ft.DEFAULT_PASSWORD, is_active=False)
+        self.UserModel.objects.filter(pk=self.stale.pk).update(date_joined=timezone.now() - timedelta(days=10))
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' '.join(str(row) for row in cursor.fetchall())
+
+    def test_filters_by_activation_state(self):
+        self.assertEqual(list(self.UserModel.objects.active()), [self.active])
+        self.assertEqual(list(self.UserModel.objects.pending_activation().order_by('pk')), [self.pending, self.stale])
+        self.assertEqual(list(self.UserModel.objects.stale_pending(timedelta(days=7))), [self.stale])
+
+    def test_email_lookups_chain(self):
+        self.assertEqual(self.UserModel.objects.active().get_by_email('ACTIVE@x.pl'), self.active)
+        self.assertEqual(self.UserModel.objects.pending_activation().get_for_authentication('pending@x.pl'),
+                         self.pending)
+        with self.assertRaises(self.UserModel.DoesNotExist):
+            self.UserModel.objects.active().get_for_authentication('pending@x.pl')
+
+    def test_uses_partial_indexes(self):
+        plan = self.query_plan(self.UserModel.objects.active().order_by('email'))
+        self.assertIn('USING INDEX users_user_active_email', plan)
+        plan = self.query_plan(self.UserModel.objects.stale_pending(timedelta(days=7)))
+        self.assertIn('USING INDEX users_user_pending_date_joined', plan)
+        for queryset in (self.UserModel.objects.active(), self.UserModel.objects.pending_activation()):
+            plan = self.query_plan(queryset.filter_by_email('jan@x.pl'))
+            self.assertIn('users_user_email_lower_uniq', plan)
+            self.assertNotIn('SCAN', plan.replace('SCAN CONSTANT', ''))
@@ -93,6 +93,28 @@ class UserModelTestCase(TestCase):
         )
 
 
+class UserModelEmailSkeletonTestCase(TestCase):
+
+    def test_email_skeleton_is_saved(self):
+        user = UserModel.objects.create_user(email='Modern@Example.COM', password=ft.DEFAULT_PASSWORD)
+        self.assertEqual(user.email_skeleton, 'Modern@exarnple.corn')
+        user.refresh_from_db()
+        self.assertEqual(user.email_skeleton, 'Modern@exarnple.corn')
+
+    def test_email_skeleton_is_saved_with_update_fields(self):
+        user = UserModel.objects.create_user(email='alice@example.com', password=ft.DEFAULT_PASSWORD)
+        user.email = 'bob@example.com'
+        user.save(update_fields=['email'])
+        user.refresh_from_db()
+        self.assertEqual(user.email_skeleton, 'bob@exarnple.corn')
+
+    def test_lookalike_emails_have_same_skeleton(self):
+        self.assertEqual(
+            UserModel.get_email_skeleton(u'p\u0430yp\u0430l@example.com'),
+            UserModel.get_email_skeleton('paypal@example.com'),
+        )
+
+
 class UserModelNormalUserTestCase(UserModelTestCase):
     ##############################################
     # --------------NORMAL USER----------------- #
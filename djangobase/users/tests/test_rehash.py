@@ -0,0 +1,139 @@
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user, hashers
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpRequest
+from django.test import TransactionTestCase, override_settings
+
+from . import factories as ft
+from .. import rehash
+from ..auth import EmailBackend
+
+
+# upgrades are remembered in a cache shared by workers
+CACHE_DIR = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+def outdated_hash(password):
+    return hashers.PBKDF2PasswordHasher().encode(password, 'salt', iterations=1000)
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=['users.auth.EmailBackend'],
+    AUTH_PASSWORD_VALIDATORS=[],
+    USERS_REHASH_INTERVAL=0.01,
+    USERS_DEFERRED_REHASH=True,
+    USERS_REHASH_CACHE='shared',
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': CACHE_DIR},
+    },
+)
+class DeferredRehashTestCase(TransactionTestCase):
+    # hashes are saved by the rehash thread, so data must be committed
+
+    def setUp(self):
+        # fresh queue and upgrades cache for every test
+        fresh_queue = override_settings(USERS_REHASH_BATCH_SIZE=rehash.DEFAULT_BATCH_SIZE)
+        fresh_queue.enable()
+        self.addCleanup(fresh_queue.disable)
+        rehash.get_cache().clear()
+        self.user = ft.create_user('user@example.com', ft.DEFAULT_PASSWORD, is_active=True)
+        self.user.password = outdated_hash(ft.DEFAULT_PASSWORD)
+        self.user.save()
+        self.backend = EmailBackend()
+
+    def test_upgrade_is_deferred(self):
+        queue = rehash.get_queue()
+        user = self.backend.authenticate(None, username='user@example.com', password=ft.DEFAULT_PASSWORD)
+        self.assertEqual(user, self.user)
+        # returned user keeps the hash it logged in with
+        self.assertEqual(user.password, self.user.password)
+        queue.flush()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$%d$' % hashers.PBKDF2PasswordHasher.iterations))
+        self.assertTrue(self.user.check_password(ft.DEFAULT_PASSWORD))
+        self.assertEqual(queue.stats['updated'], 1)
+
+    def test_wrong_password_is_not_upgraded(self):
+        self.assertIsNone(self.backend.authenticate(None, username='user@example.com', password='wrong'))
+        self.assertEqual(rehash.get_queue().stats['queued'], 0)
+
+    @override_settings(USERS_REHASH_CACHE='default')
+    def test_requires_shared_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.backend.authenticate(None, username='user@example.com', password=ft.DEFAULT_PASSWORD)
+
+    def test_not_deferred_by_default(self):
+        with override_settings():
+            del settings.USERS_DEFERRED_REHASH
+            self.assertFalse(rehash.is_deferred())
+
+    def test_password_changed_meanwhile_is_kept(self):
+        queue = rehash.RehashQueue()
+        queue.put(self.user, ft.DEFAULT_PASSWORD)
+        self.user.set_password('new_password')
+        self.user.save()
+        queue.flush()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new_password'))
+        self.assertEqual(queue.stats['stale'], 1)
+
+    def test_batches_updates(self):
+        users = [self.user] + [
+            ft.create_user('user%d@example.com' % i, ft.DEFAULT_PASSWORD, is_active=True) for i in range(3)
+        ]
+        queue = rehash.RehashQueue(batch_size=10)
+        with self.assertNumQueries(1):
+            queue.process([(type(u), u.pk, u.password, ft.DEFAULT_PASSWORD) for u in users])
+        self.assertEqual(queue.stats['updated'], 4)
+
+    def test_full_queue_drops_upgrade(self):
+        queue = rehash.RehashQueue(maxsize=1)
+        queue._start = lambda: None
+        self.assertTrue(queue.put(self.user, ft.DEFAULT_PASSWORD))
+        self.assertFalse(queue.put(self.user, ft.DEFAULT_PASSWORD))
+        self.assertEqual(queue.stats['dropped'], 1)
+
+    @override_settings(USERS_DEFERRED_REHASH=False)
+    def test_inline_upgrade_when_not_deferred(self):
+        user = self.backend.authenticate(None, username='user@example.com', password=ft.DEFAULT_PASSWORD)
+        self.assertFalse(hashers.get_hasher().must_update(user.password))
+        self.assertEqual(rehash.get_queue().stats['queued'], 0)
+
+    def test_session_survives_upgrade(self):
+        self.assertTrue(self.client.login(email='user@example.com', password=ft.DEFAULT_PASSWORD))
+        rehash.get_queue().flush()
+        request = HttpRequest()
+        request.session = self.client.session
+        self.assertEqual(get_user(request), self.user)
+
+        self.user.refresh_from_db()
+        self.user.set_password('new_password')
+        self.user.save()
+        self.assertTrue(get_user(request).is_anonymous)
+
+    def test_serving_alias_extends_it(self):
+        self.assertTrue(self.client.login(email='user@example.com', password=ft.DEFAULT_PASSWORD))
+        rehash.get_queue().flush()
+        self.user.refresh_from_db()
+        key = rehash._cache_key(type(self.user), self.user.pk)
+        expires = rehash.get_cache().get(key)[2]
+        # a login late in the alias' life binds a session for a full SESSION_COOKIE_AGE
+        later = expires - 60
+        with mock.patch.object(time, 'time', return_value=later):
+            session_hash = rehash.session_hash_password(self.user)
+        self.assertNotEqual(session_hash, self.user.password)
+        self.assertEqual(rehash.get_cache().get(key)[2], later + settings.SESSION_COOKIE_AGE)
+        # not written again right away
+        with mock.patch.object(rehash, '_set_aliases') as set_aliases:
+            rehash.session_hash_password(self.user)
+        self.assertFalse(set_aliases.called)
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import threading
+
+from django.test import SimpleTestCase, override_settings
+
+from ..reloading import ReloadableData
+
+
+class ReloadableDataTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'data.txt')
+        self.write('v1')
+        self.loads = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, content):
+        # replace atomically and make sure the signature changes
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        self.loads += 1
+        with open(self.path) as f:
+            return f.read()
+
+    def test_loads_lazily_once(self):
+        data = ReloadableData(lambda: [self.path], self.load)
+        self.assertEqual(self.loads, 0)
+        self.assertEqual(data.get(), 'v1')
+        self.assertEqual(data.get(), 'v1')
+        self.assertEqual(self.loads, 1)
+        self.assertIsNone(data.check())
+
+    def test_reloads_changed_file_in_background(self):
+        data = ReloadableData(lambda: [self.path], self.load)
+        self.assertEqual(data.get(), 'v1')
+        self.write('v2 with other size')
+        data.check().join()
+        self.assertEqual(data.get(), 'v2 with other size')
+        self.assertEqual(data.reloads, 1)
+
+    def test_serves_old_value_while_reloading(self):
+        started, release = threading.Event(), threading.Event()
+
+        def slow_load():
+            value = self.load()
+            if self.loads > 1:
+                started.set()
+                release.wait(5)
+            return value
+
+        data = ReloadableData(lambda: [self.path], slow_load)
+        data.get()
+        self.write('v2 with other size')
+        thread = data.check()
+        started.wait(5)
+        self.assertEqual(data.get(), 'v1')
+        # only one reload runs at a time
+        self.assertIsNone(data.check())
+        release.set()
+        thread.join()
+        self.assertEqual(data.get(), 'v2 with other size')
+
+    def test_keeps_old_value_when_reload_fails(self):
+        def load():
+            value = self.load()
+            if value == 'broken':
+                raise ValueError(value)
+            return value
+
+        data = ReloadableData(lambda: [self.path], load)
+        data.get()
+        self.write('broken')
+        with self.assertLogs('users.reloading', 'ERROR'):
+            data.check().join()
+        self.assertEqual(data.get(), 'v1')
+        self.assertIsNone(data.check())
+
+    @override_settings(USERS_DATAFILES_RELOAD_INTERVAL=0)
+    def test_reload_checks_can_be_disabled(self):
+        data = ReloadableData(lambda: [self.path], self.load)
+        data.get()
+        self.write('v2 with other size')
+        data.get()
+        self.assertEqual(data.get(), 'v1')
@@ -0,0 +1,116 @@
+import threading
+
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from . import factories as ft
+from ..forms import AuthenticationForm
+from ..throttle import LoginThrottle, login_throttle
+
+START = 6000.0
+
+
+@override_settings(USERS_LOGIN_THROTTLE_RATES={'email': (3, 60), 'ip': (5, 60)})
+class LoginThrottleTestCase(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.throttle = LoginThrottle()
+        self.request = RequestFactory().post('/login/', REMOTE_ADDR='10.0.0.1')
+
+    def attempts(self, email, count, now=START, request=None):
+        """
+        Make ``count`` failed logins, returns results of attempts.
+        """
+        return [self.throttle.attempt(request, email, now=now) for _ in range(count)]
+
+    def test_limits_attempts_per_email(self):
+        self.assertEqual(self.attempts('jan@x.pl', 4), [None, None, None, 'email'])
+        # case-insensitive, like email lookup
+        self.assertEqual(self.attempts('JAN@x.pl', 1), ['email'])
+        self.assertEqual(self.attempts('anna@x.pl', 1), [None])
+
+    def test_limits_attempts_per_ip(self):
+        results = [self.attempts('user%d@x.pl' % i, 1, request=self.request)[0] for i in range(6)]
+        self.assertEqual(results, [None] * 5 + ['ip'])
+        other = RequestFactory().post('/login/', REMOTE_ADDR='10.0.0.2')
+        self.assertIsNone(self.throttle.attempt(other, 'user9@x.pl', now=START))
+
+    def test_window_slides(self):
+        self.attempts('jan@x.pl', 3)
+        # half of previous window still counts: 1.5 + 1 attempts
+        self.assertEqual(self.attempts('jan@x.pl', 3, now=START + 90), [None, None, 'email'])
+        self.assertEqual(self.attempts('jan@x.pl', 1, now=START + 120), [None])
+
+    def test_rejected_attempts_are_not_counted(self):
+        self.attempts('jan@x.pl', 10)
+        self.assertEqual(self.attempts('jan@x.pl', 1, now=START + 120), [None])
+
+    def test_successful_logins_are_not_counted(self):
+        for _ in range(10):
+            self.assertIsNone(self.throttle.attempt(self.request, 'jan@x.pl', now=START))
+            self.throttle.success(self.request, 'jan@x.pl', now=START)
+
+    def test_concurrent_attempts_are_counted_before_they_fail(self):
+        barrier = threading.Barrier(10)
+        results = []
+
+        def attempt():
+            barrier.wait()
+            results.append(self.throttle.attempt(None, 'jan@x.pl', now=START))
+        threads = [threading.Thread(target=attempt) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(None), 3)
+        self.assertEqual(self.attempts('jan@x.pl', 1), ['email'])
+
+    def test_success_resets_email_but_not_ip(self):
+        self.attempts('jan@x.pl', 3, request=self.request, now=START - 30)
+        self.throttle.success(self.request, 'JAN@x.pl', now=START)
+        self.assertEqual(self.attempts('jan@x.pl', 3, request=self.request), [None, None, 'ip'])
+
+    def test_stats(self):
+        self.attempts('jan@x.pl', 5)
+        self.assertEqual(self.throttle.stats, {'allowed': 3, 'rejected': 2, 'rejected_email': 2})
+
+    @override_settings(USERS_LOGIN_THROTTLE_RATES={})
+    def test_disabled(self):
+        self.assertEqual(self.attempts('jan@x.pl', 20), [None] * 20)
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=['users.auth.EmailBackend'],
+    AUTH_PASSWORD_VALIDATORS=[],
+    USERS_LOGIN_THROTTLE_RATES={'email': (2, 60)},
+)
+class AuthenticationFormThrottleTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        ft.create_user('user@example.com', ft.DEFAULT_PASSWORD, is_active=True)
+
+    def test_rejects_before_authenticating(self):
+        data = dict(email='user@example.com', password='wrong')
+        for _ in range(2):
+            form = AuthenticationForm(data=data)
+            self.assertFalse(form.is_valid())
+            self.assertEqual(form.non_field_errors().as_data()[0].code, 'invalid_login')
+        form = AuthenticationForm(data=dict(email='user@example.com', password=ft.DEFAULT_PASSWORD))
+        with self.assertNumQueries(0):
+            self.assertFalse(form.is_valid())
+        self.assertEqual(form.non_field_errors().as_data()[0].code, 'throttled')
+        self.assertIsNone(form.user_cache)
+        self.assertGreaterEqual(login_throttle.stats['rejected_email'], 1)
+
+    def test_success_resets_failures(self):
+        form = AuthenticationForm(data=dict(email='user@example.com', password='wrong'))
+        self.assertFalse(form.is_valid())
+        for _ in range(3):
+            form = AuthenticationForm(data=dict(email='USER@example.com', password=ft.DEFAULT_PASSWORD))
+            self.assertTrue(form.is_valid())
+        for _ in range(2):
+            form = AuthenticationForm(data=dict(email='user@example.com', password='wrong'))
+            self.assertFalse(form.is_valid())
+            self.assertEqual(form.non_field_errors().as_data()[0].code, 'invalid_login')
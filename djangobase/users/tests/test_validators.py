@@ -1,4 +1,7 @@
-from django.test import TestCase, SimpleTestCase
+import os
+import tempfile
+
+from django.test import TestCase, SimpleTestCase, override_settings
 from django import forms
 from .. import validators
 from .. import data
@@ -71,4 +74,178 @@ class ValidatorsTestCase(SimpleTestCase):
                 with self.assertRaises(forms.ValidationError):
                     validator(v.lower())
         # @ not in value
-        self.assertIs(None, validator('test'))
\ No newline at end of file
+        self.assertIs(None, validator('test'))
+
+    def test_ReservedNameValidator_is_case_insensitive(self):
+        validator = validators.ReservedNameValidator()
+        for v in ('ADMIN', 'Webmaster', 'Robots.TXT'):
+            with self.subTest(value=v):
+                with self.assertRaises(forms.ValidationError):
+                    validator(v)
+        self.assertIs(None, validator('alice'))
+
+    def test_ReservedNameValidator_rejects_reserved_prefixes(self):
+        validator = validators.ReservedNameValidator()
+        for v in ('.well-known', '.well-known/acme-challenge', '.Well-Known/x'):
+            with self.subTest(value=v):
+                with self.assertRaises(forms.ValidationError):
+                    validator(v)
+
+    def test_ReservedNameValidator_indexes_custom_names(self):
+        validator = validators.ReservedNameValidator(reserved_names=['Alice', 'bob'])
+        for v in ('alice', 'ALICE', 'Bob', '.well-known'):
+            with self.subTest(value=v):
+                with self.assertRaises(forms.ValidationError):
+                    validator(v)
+        self.assertIs(None, validator('admin'))
+
+    def test_ReservedNameValidator_shares_index_for_same_names(self):
+        self.assertIs(
+            validators.ReservedNameValidator().index,
+            validators.ReservedNameValidator().index,
+        )
+
+    @override_settings(USERS_CONFUSABLES_CACHE_SIZE=8)
+    def test_confusables_verdicts_are_cached(self):
+        cache = validators.get_confusables_cache()
+        self.assertEqual(cache.maxsize, 8)
+        validators.validate_confusables_email(u'alice@пример.рф')
+        validators.validate_confusables_email(u'bob@пример.рф')
+        self.assertEqual(cache.info(), {'size': 1, 'maxsize': 8, 'hits': 1, 'misses': 1})
+        with self.assertRaises(forms.ValidationError):
+            validators.validate_confusables_email(u'p\u0430yp\u0430l@gmail.com')
+        with self.assertRaises(forms.ValidationError):
+            validators.validate_confusables_email(u'p\u0430yp\u0430l@gmail.com')
+
+    def test_ascii_and_latin_values_skip_confusables_cache(self):
+        cache = validators.get_confusables_cache()
+        cache.clear()
+        validators.validate_confusables('alice.smith')
+        validators.validate_confusables(u'zażółć')
+        validators.validate_confusables_email('alice@gmail.com')
+        self.assertEqual(cache.info()['misses'], 0)
+
+    def test_lowercased_value_is_not_fast_pathed(self):
+        # 'İ' is Latin, but lowercases to 'i' + combining dot above
+        self.assertFalse(validators.confusables.cannot_be_mixed_script(u'İa'))
+
+    def test_validate_confusables_email_decodes_punycode_domain(self):
+        # xn--80ak6aa92e.com is displayed as cyrillic 'аррӏе' + '.com'
+        with self.assertRaises(forms.ValidationError):
+            validators.validate_confusables_email('alice@xn--80ak6aa92e.com')
+        self.assertIs(None, validators.validate_confusables_email('alice@xn--e1afmkfd.xn--p1ai'))
+        self.assertIs(None, validators.validate_confusables_email('alice@xn--bad-.com'))
+
+    def test_validate_many(self):
+        values = [
+            'alice@example.com',
+            u'pаypаl@example.com',
+            u'paypal@exаmple.com',
+            'alice@xn--80ak6aa92e.com',
+            'alice',
+            'Admin',
+            u'pаypаl',
+            1,
+        ]
+        self.assertEqual(list(validators.validate_many(values)), [
+            ('alice@example.com', []),
+            (u'pаypаl@example.com', ['confusable_email']),
+            (u'paypal@exаmple.com', ['confusable_email']),
+            ('alice@xn--80ak6aa92e.com', ['confusable_email']),
+            ('alice', []),
+            ('Admin', ['reserved_name']),
+            (u'pаypаl', ['confusable_value']),
+            (1, []),
+        ])
+
+    def test_validate_many_matches_single_value_validators(self):
+        values = self.consfusables + self.consfusables_emails + self.reserved_names
+        reserved_name = validators.ReservedNameValidator()
+        for value, codes in validators.validate_many(values):
+            expected = []
+            single = [validators.validate_confusables_email] if '@' in value else \
+                [reserved_name, validators.validate_confusables]
+            for validator in single:
+                try:
+                    validator(value)
+                except forms.ValidationError as e:
+                    expected.append(e.code)
+            with self.subTest(value=value):
+                self.assertEqual(codes, expected)
+
+    def test_validate_many_is_lazy(self):
+        results = validators.validate_many(iter(['alice', 'admin']))
+        self.assertEqual(next(results), ('alice', []))
+
+    def test_ReservedNameValidator_substring_mode(self):
+        validator = validators.ReservedNameValidator(substring=True, allowed_names=['Administratorka'])
+        for value, term in (('admin1', 'admin'), ('Support-Team', 'support'), ('my.robots.txt', 'robots.txt')):
+            with self.subTest(value=value):
+                with self.assertRaises(forms.ValidationError) as cm:
+                    validator(value)
+                self.assertEqual(cm.exception.params, {'reserved_name': term})
+        self.assertIs(None, validator('administratorka'))
+        self.assertIs(None, validator('alice'))
+        # short reserved names are only reserved exactly
+        for value in ('christopher', 'james', 'smith', 'tomek', 'popescu', 'Medoc'):
+            with self.subTest(value=value):
+                self.assertIs(None, validator(value))
+        with self.assertRaises(forms.ValidationError):
+            validator('me')
+        # exact mode stays the default
+        self.assertIs(None, validators.ReservedNameValidator()('admin1'))
+
+    def test_validate_disposable_email(self):
+        validator = validators.validate_disposable_email
+        for v in ('alice@mailinator.com', 'alice@YOPMAIL.com', 'alice@eu.mailinator.com'):
+            with self.subTest(value=v):
+                with self.assertRaises(forms.ValidationError) as cm:
+                    validator(v)
+                self.assertEqual(cm.exception.code, 'disposable_email')
+        self.assertIs(None, validator('alice@gmail.com'))
+        self.assertIs(None, validator('alice@mailinator.com.example.org'))
+        self.assertIs(None, validator('test'))
+
+    def test_reserved_names_file_matches_data_module(self):
+        names = validators.reserved_names.get()
+        self.assertEqual(names.version, '1')
+        self.assertEqual(names.index.names, frozenset(data.DEFAULT_RESERVED_NAMES))
+        self.assertEqual(names.index.prefixes, tuple(data.DEFAULT_RESERVED_PREFIXES))
+
+    def test_ReservedNameValidator_takes_other_list_from_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'reserved_names.txt')
+            with open(path, 'w') as f:
+                f.write('# version: 1\nalice\nstaff*\n')
+            with override_settings(USERS_RESERVED_NAMES_FILE=path):
+                validator = validators.ReservedNameValidator(reserved_prefixes=['team-'])
+                for v in ('Alice', 'team-bob'):
+                    with self.subTest(value=v):
+                        with self.assertRaises(forms.ValidationError):
+                            validator(v)
+                self.assertIs(None, validator('admin'))
+                validator = validators.ReservedNameValidator(reserved_names=['bob'])
+                with self.assertRaises(forms.ValidationError):
+                    validator('staff-anna')
+                self.assertIs(None, validator('.well-known'))
+
+    def test_ReservedNameValidator_reloads_reserved_names_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'reserved_names.txt')
+            with open(path, 'w') as f:
+                f.write('# version: 1\nalice\nstaff*\n')
+            with override_settings(USERS_RESERVED_NAMES_FILE=path):
+                validator = validators.ReservedNameValidator()
+                with self.assertRaises(forms.ValidationError):
+                    validator('Alice')
+                with self.assertRaises(forms.ValidationError):
+                    validator('staff-bob')
+                self.assertIs(None, validator('bob'))
+
+                with open(path, 'w') as f:
+                    f.write('# version: 2\nbob  # new name\n')
+                validators.reserved_names.check().join()
+                self.assertEqual(validators.reserved_names.get().version, '2')
+                with self.assertRaises(forms.ValidationError):
+                    validator('bob')
+                self.assertIs(None, validator('alice'))
@@ -0,0 +1,145 @@
+"""
+Login throttling checked before any password is hashed.
+
+Failed logins are counted per email and per client IP with
+sliding-window counters kept in cache (use a shared cache to throttle
+across workers). A window's count is estimated from two fixed windows:
+the current one plus the previous one weighted by how much of it still
+overlaps the sliding window:
+
+    USERS_LOGIN_THROTTLE_RATES = {
+        'email': (10, 60),   # 10 failed logins per email per minute
+        'ip': (100, 60),     # 100 failed logins per IP per minute
+    }
+    USERS_LOGIN_THROTTLE_CACHE = 'default'
+    USERS_LOGIN_THROTTLE_IP_META = 'REMOTE_ADDR'  # e.g. 'HTTP_X_REAL_IP' behind a proxy
+
+Each attempt is counted as a failure up front, with an atomic increment,
+so a burst of concurrent attempts can't all pass before the first of
+them fails; at most the limit gets to the password hasher. A successful
+login gives its attempt back and resets the count of its email, but not
+the rest of the count of its IP, which may be guessing passwords of
+other accounts. Rejected attempts are given back too, so they don't
+extend a lockout.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULT_RATES = {
+    'email': (10, 60),
+    'ip': (100, 60),
+}
+
+
+class LoginThrottle(object):
+
+    def __init__(self):
+        self.stats = {'allowed': 0, 'rejected': 0}
+
+    @staticmethod
+    def get_rates():
+        return getattr(settings, 'USERS_LOGIN_THROTTLE_RATES', DEFAULT_RATES) or {}
+
+    @staticmethod
+    def get_cache():
+        return caches[getattr(settings, 'USERS_LOGIN_THROTTLE_CACHE', 'default')]
+
+    @staticmethod
+    def get_idents(request, email):
+        """
+        Return ``{scope: identifier}`` of an attempt.
+        """
+        idents = {}
+        if email:
+            idents['email'] = email.lower()
+        if request is not None:
+            ip = request.META.get(getattr(settings, 'USERS_LOGIN_THROTTLE_IP_META', 'REMOTE_ADDR'))
+            if ip:
+                idents['ip'] = ip
+        return idents
+
+    @staticmethod
+    def _key(scope, ident, window):
+        digest = hashlib.sha1(ident.encode('utf-8')).hexdigest()
+        return 'users:throttle:%s:%s:%d' % (scope, digest, window)
+
+    def get_keys(self, request, email, now):
+        """
+        Return ``{scope: (previous key, current key, elapsed part of
+        current window)}`` of scopes with a rate.
+        """
+        rates = self.get_rates()
+        keys = {}
+        for scope, ident in self.get_idents(request, email).items():
+            if scope not in rates:
+                continue
+            period = rates[scope][1]
+            window = int(now // period)
+            keys[scope] = (self._key(scope, ident, window - 1), self._key(scope, ident, window), now / period - window)
+        return keys
+
+    def attempt(self, request, email, now=None):
+        """
+        Reserve login attempt for ``email`` from ``request``, counted
+        as failed until ``success`` is called. Returns scope whose
+        limit was reached, e.g. ``'email'``, or ``None`` if the attempt
+        is allowed.
+        """
+        keys = self.get_keys(request, email, time.time() if now is None else now)
+        if not keys:
+            return None
+        rates = self.get_rates()
+        cache = self.get_cache()
+        previous_counts = cache.get_many([previous for previous, current, _ in keys.values()])
+        # increment first, concurrent attempts see each other's counts
+        counts = {scope: self._incr(cache, current, 2 * rates[scope][1]) for scope, (_, current, _) in keys.items()}
+        for scope, (previous, current, elapsed) in sorted(keys.items()):
+            estimate = previous_counts.get(previous, 0) * (1 - elapsed) + counts[scope] - 1
+            if estimate >= rates[scope][0]:
+                for _, current, _ in keys.values():
+                    self._decr(cache, current)
+                self.stats['rejected'] += 1
+                self.stats['rejected_' + scope] = self.stats.get('rejected_' + scope, 0) + 1
+                return scope
+        self.stats['allowed'] += 1
+        return None
+
+    def success(self, request, email, now=None):
+        """
+        Give back attempt reserved for successful login and reset
+        failed logins counted for ``email``.
+        """
+        keys = self.get_keys(request, email, time.time() if now is None else now)
+        if not keys:
+            return
+        cache = self.get_cache()
+        if 'ip' in keys:
+            self._decr(cache, keys['ip'][1])
+        if 'email' in keys:
+            cache.delete_many(keys['email'][:2])
+
+    @staticmethod
+    def _incr(cache, key, timeout):
+        # kept until it stops being the previous window
+        if cache.add(key, 1, timeout):
+            return 1
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # expired meanwhile
+            cache.add(key, 1, timeout)
+            return 1
+
+    @staticmethod
+    def _decr(cache, key):
+        try:
+            cache.decr(key)
+        except ValueError:
+            # expired, or the window moved on since the attempt
+            pass
+
+
+login_throttle = LoginThrottle()
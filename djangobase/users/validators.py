@@ -3,33 +3,241 @@ Error messages, data and custom validation code used in
 django-registration's various user-registration form classes.
 
 """
-from confusable_homoglyphs import confusables
+import functools
+import os
+
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.utils import six
 from django.utils.translation import ugettext_lazy as _
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
-from . import data
+from . import blocklist, confusables
+from .ahocorasick import Automaton
+from .cache import LRUCache
+from .reloading import ReloadableData
 
 CONFUSABLE = _(u'Popraw błędy...')
 CONFUSABLE_EMAIL = _(u'Ten adres e-mail nie może zostać użyty')
 RESERVED_NAME = _(u'Popraw błędy...')
+DISPOSABLE_EMAIL = _(u'Ten adres e-mail nie może zostać użyty')
+
+DEFAULT_RESERVED_NAMES_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'datafiles', 'reserved_names.txt'
+)
+
+# Number of strings whose confusables verdict is remembered,
+# override with USERS_CONFUSABLES_CACHE_SIZE setting.
+DEFAULT_CONFUSABLES_CACHE_SIZE = 4096
+
+_confusables_cache = None
+
+# Number of verdicts ``validate_many`` remembers within one batch.
+VALIDATE_MANY_CACHE_SIZE = 65536
+
+# Shorter reserved names, e.g. 'me' or 'pop', are only matched
+# exactly, as substrings they'd reject names like 'james' or 'popescu'.
+SUBSTRING_MIN_LENGTH = 4
+
+
+def get_confusables_cache():
+    """
+    Return process-wide ``LRUCache`` with confusables verdicts.
+    """
+    global _confusables_cache
+    if _confusables_cache is None:
+        _confusables_cache = LRUCache(
+            maxsize=getattr(settings, 'USERS_CONFUSABLES_CACHE_SIZE', DEFAULT_CONFUSABLES_CACHE_SIZE)
+        )
+    return _confusables_cache
+
+
+@receiver(setting_changed)
+def reset_confusables_cache(**kwargs):
+    global _confusables_cache
+    if kwargs['setting'] == 'USERS_CONFUSABLES_CACHE_SIZE':
+        _confusables_cache = None
+
+
+def _is_dangerous(value):
+    return bool(confusables.is_dangerous(value) or confusables.is_dangerous(value.lower()))
+
+
+def is_dangerous(value):
+    """
+    Cached check whether ``value`` or its lowercased
+    form is mixed-script and contains confusables.
+    """
+    # most values are plain ASCII or Latin, skip both
+    # per-character analysis and the cache for them
+    if confusables.cannot_be_mixed_script(value):
+        return False
+    return get_confusables_cache().get_or_set(value, _is_dangerous)
+
+
+def idna_decode(domain):
+    """
+    Decode punycode labels of ``domain``, so 'xn--' domains are
+    judged by the characters they are displayed with.
+    """
+    if 'xn--' not in domain.lower():
+        return domain
+    try:
+        return domain.encode('ascii').decode('idna')
+    except UnicodeError:
+        return domain
+
+
+class ReservedNameIndex(object):
+    """
+    Casefolded view of a reserved names list, so membership
+    tests are a single hash lookup instead of list scans.
+    Names starting with any of ``prefixes`` are reserved too.
+    """
+    def __init__(self, names, prefixes=()):
+        self.names = frozenset(name.casefold() for name in names)
+        self.prefixes = tuple(prefix.casefold() for prefix in prefixes)
+
+    def __contains__(self, value):
+        value = value.casefold()
+        return value in self.names or value.startswith(self.prefixes)
+
+    def match(self, value):
+        """
+        Return reserved name or prefix matching ``value`` or ``None``.
+        """
+        value = value.casefold()
+        if value in self.names:
+            return value
+        for prefix in self.prefixes:
+            if value.startswith(prefix):
+                return prefix
+        return None
+
+
+class ReservedNames(object):
+    """
+    Reserved names and prefixes with their indexes, for exact
+    lookups and for finding reserved names inside a value.
+    """
+    def __init__(self, names, prefixes=(), version=''):
+        self.version = version
+        self.index = ReservedNameIndex(names, prefixes)
+        self.automaton = Automaton(sorted(
+            name for name in self.index.names if len(name) >= SUBSTRING_MIN_LENGTH
+        ))
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Load names from text file at ``path``: one name per line,
+        lines ending with '*' are prefixes, '#' starts a comment
+        and '# version: ...' line sets the version.
+        """
+        names, prefixes, version = [], [], ''
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('#'):
+                    key, _, value = line[1:].partition(':')
+                    if key.strip() == 'version' and not version:
+                        version = value.strip()
+                    continue
+                line = line.split(' #', 1)[0].strip()
+                if line.endswith('*'):
+                    prefixes.append(line[:-1])
+                elif line:
+                    names.append(line)
+        return cls(names, prefixes, version)
+
+
+@functools.lru_cache(maxsize=None)
+def get_reserved_names(names, prefixes=()):
+    """
+    Return ``ReservedNames`` for given tuples (or frozensets) of names
+    and prefixes. Each configured list is indexed only once per process.
+    """
+    return ReservedNames(names, prefixes)
+
+
+def get_reserved_names_file():
+    return getattr(settings, 'USERS_RESERVED_NAMES_FILE', DEFAULT_RESERVED_NAMES_FILE)
+
+
+# Default reserved names, re-read in the background when the file changes.
+reserved_names = ReloadableData(
+    paths=lambda: [get_reserved_names_file()],
+    loader=lambda: ReservedNames.from_file(get_reserved_names_file()),
+)
+
+
+@receiver(setting_changed)
+def reset_reserved_names(**kwargs):
+    if kwargs['setting'] == 'USERS_RESERVED_NAMES_FILE':
+        reserved_names.reset()
+
+
+def resolve_reserved_names(names=None, prefixes=None):
+    """
+    Return ``ReservedNames`` for custom names and prefixes,
+    taking the one not given from current contents of reserved
+    names file, or the file's contents if neither is given.
+    """
+    if names is not None and prefixes is not None:
+        return get_reserved_names(tuple(names), tuple(prefixes))
+    current = reserved_names.get()
+    if names is None and prefixes is None:
+        return current
+    return get_reserved_names(
+        current.index.names if names is None else tuple(names),
+        current.index.prefixes if prefixes is None else tuple(prefixes),
+    )
 
 
 class ReservedNameValidator(object):
-    """ Validator which disallows many reserved names """
-    def __init__(self, reserved_names=data.DEFAULT_RESERVED_NAMES):
+    """
+    Validator which disallows many reserved names.
+
+    By default names are read from ``USERS_RESERVED_NAMES_FILE``
+    (``datafiles/reserved_names.txt``) and reloaded when it changes;
+    passing ``reserved_names`` or ``reserved_prefixes`` pins the lists.
+
+    With ``substring=True`` it also disallows values containing
+    a reserved name of at least ``SUBSTRING_MIN_LENGTH`` characters,
+    e.g. 'admin1' or 'support-team', except values listed in
+    ``allowed_names``. Matched name is passed to
+    ``ValidationError`` as ``reserved_name`` param.
+    """
+    def __init__(self, reserved_names=None, reserved_prefixes=None,
+                 substring=False, allowed_names=()):
         self.reserved_names = reserved_names
+        self.reserved_prefixes = reserved_prefixes
+        self.substring = substring
+        self.allowed_names = frozenset(name.casefold() for name in allowed_names)
+
+    @property
+    def index(self):
+        return resolve_reserved_names(self.reserved_names, self.reserved_prefixes).index
+
+    def match(self, value):
+        names = resolve_reserved_names(self.reserved_names, self.reserved_prefixes)
+        match = names.index.match(value)
+        if match is None and self.substring:
+            value = value.casefold()
+            if value not in self.allowed_names:
+                match = names.automaton.search(value)
+        return match
 
     def __call__(self, value):
         # this validator only makes sense when
         # the username field is a string type
         if not isinstance(value, six.text_type):
             return
-        if value in self.reserved_names or \
-            value.lower() in self.reserved_names or \
-           value.startswith('.well-known'):     # https://tools.ietf.org/html/rfc5785
+        match = self.match(value)
+        if match is not None:
             raise ValidationError(
-                RESERVED_NAME, code='reserved_name'
+                RESERVED_NAME, code='reserved_name', params={'reserved_name': match}
             )
 
 
@@ -45,8 +253,7 @@ def validate_confusables(value):
     """
     if not isinstance(value, six.text_type):
         return
-    if confusables.is_dangerous(value) or \
-            confusables.is_dangerous(value.lower()):
+    if is_dangerous(value):
         raise ValidationError(CONFUSABLE, code='confusable_value')
 
 
@@ -64,8 +271,68 @@ def validate_confusables_email(value):
     if '@' not in value:
         return
     local_part, domain = value.split('@')
-    if confusables.is_dangerous(local_part) or \
-            confusables.is_dangerous(local_part.lower()) or \
-            confusables.is_dangerous(domain) or \
-            confusables.is_dangerous(domain.lower()):
+    if is_dangerous(local_part) or is_dangerous(idna_decode(domain)):
         raise ValidationError(CONFUSABLE_EMAIL, code='confusable_email')
+
+
+def validate_disposable_email(value):
+    """
+    Validator which disallows email addresses from disposable
+    (throwaway) email providers.
+
+    An email address is disposable if its domain or any of its
+    parent domains is on the disposable domains blocklist,
+    see ``users.blocklist``.
+
+    """
+    if not isinstance(value, six.text_type) or '@' not in value:
+        return
+    domain = value.rpartition('@')[2]
+    match = blocklist.get_disposable_domains().match(domain)
+    if match is not None:
+        raise ValidationError(DISPOSABLE_EMAIL, code='disposable_email', params={'domain': match})
+
+
+def validate_many(values, reserved_names=None, reserved_prefixes=None):
+    """
+    Validate an iterable of emails and usernames in one pass.
+
+    Yields ``(value, codes)`` tuples in input order, where ``codes``
+    is a list of error codes the single-value validators would raise.
+    Values containing '@' are checked like ``validate_confusables_email``,
+    other strings like ``ReservedNameValidator`` and ``validate_confusables``.
+
+    Verdicts for repeated local parts, domains and usernames are
+    computed once per batch; the reserved names index and the
+    confusables table are shared with the single-value validators.
+    """
+    reserved = resolve_reserved_names(reserved_names, reserved_prefixes).index
+    verdicts = {}
+
+    def dangerous(key, value):
+        try:
+            return verdicts[key]
+        except KeyError:
+            pass
+        # keep memory flat on huge batches
+        if len(verdicts) >= VALIDATE_MANY_CACHE_SIZE:
+            verdicts.clear()
+        verdict = verdicts[key] = is_dangerous(value)
+        return verdict
+
+    for value in values:
+        codes = []
+        if not isinstance(value, six.text_type):
+            yield value, codes
+            continue
+        if '@' in value:
+            local_part, _, domain = value.rpartition('@')
+            if dangerous(local_part, local_part) or \
+                    dangerous('@' + domain, idna_decode(domain)):
+                codes.append('confusable_email')
+        else:
+            if value in reserved:
+                codes.append('reserved_name')
+            if dangerous(value, value):
+                codes.append('confusable_value')
+        yield value, codes
@@ -10,6 +10,7 @@ from django.db import models
 from django.core import signing
 from django.template.loader import render_to_string
 from django.core.mail import send_mail
+from users.coalesce import coalesced
 UserModel = get_user_model()
 
 
@@ -103,14 +104,13 @@ class UserActivationView(AnonymousRequiredMixin, TemplateView):
         corresponding user account if it exists
         or 'None' if it doesn't.
         """
-        try:
-            user = UserModel.objects.get(
-                email=email,
-                is_active=False
-            )
-            return user
-        except UserModel.DoesNotExist:
-            return None
+        def lookup():
+            try:
+                return UserModel.objects.pending_activation().get_for_authentication(email)
+            except UserModel.DoesNotExist:
+                return None
+        # concurrent requests for the same email share one query
+        return coalesced(('email', email, False), lookup)
 
 
 class UserPasswordRecoverySuccessView(AnonymousRequiredMixin, FormView):
@@ -143,14 +143,13 @@ class UserPasswordRecoveryView(AnonymousRequiredMixin, FormView):
         corresponding user account if it exists
         or 'None' if it doesn't.
         """
-        try:
-            user = UserModel.objects.get(
-                email=email,
-                is_active=True,
-            )
-            return user
-        except UserModel.DoesNotExist:
-            return None
+        def lookup():
+            try:
+                return UserModel.objects.active().get_for_authentication(email)
+            except UserModel.DoesNotExist:
+                return None
+        # concurrent requests for the same email share one query
+        return coalesced(('email', email, True), lookup)
 
 
 class BaseEmailActivator: